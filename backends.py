@@ -0,0 +1,74 @@
+import os
+import shutil
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+base_dir = "base_dir"  # 根目录路径
+calibration_data = os.path.join(base_dir, "steel.yaml")  # int8 量化校准使用的数据集配置（取其中的 val 划分，即 datasets/steel/images/val）
+export_imgsz = 640     # 导出模型的输入尺寸（导出后固定，需与推理尺寸一致）
+# --------------------------------------------------------------------------
+
+# 推理后端：ultralytics 导出格式，以及导出结果相对权重文件的缓存名称（int8 时在名称中加 _int8）
+BACKENDS = {
+    "pt": None,                                  # 原始 PyTorch 权重，不导出
+    "onnx": ("onnx", "{stem}{int8}.onnx"),       # ONNX Runtime（CPU）
+    "openvino": ("openvino", "{stem}{int8}_openvino_model"),  # OpenVINO（Intel CPU 上通常最快，支持 int8）
+}
+INT8_BACKENDS = ("openvino",)  # ultralytics 支持 int8 校准量化导出的后端
+
+
+def exported_path(weights, backend, int8=False):
+    """导出模型的缓存路径（与权重文件放在同一文件夹）"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推理后端 '{backend}'，可选: {', '.join(BACKENDS)}")
+    if BACKENDS[backend] is None:
+        return weights
+    stem = os.path.splitext(weights)[0]
+    return BACKENDS[backend][1].format(stem=stem, int8="_int8" if int8 else "")
+
+
+def is_fresh(path, weights):
+    """导出结果存在且不早于权重文件时视为可复用"""
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+def export_model(weights, backend, int8=False, data=calibration_data, imgsz=export_imgsz):
+    """
+    将训练好的权重导出为 CPU 优化格式并缓存，已有最新的导出结果时直接返回其路径
+
+    Args:
+        weights (str): .pt 权重路径
+        backend (str): onnx / openvino
+        int8 (bool): 是否做 int8 量化（以 data 中的 val 划分作为校准集）
+        data (str): 数据集配置文件
+        imgsz (int): 导出的输入尺寸
+    """
+    if int8 and backend not in INT8_BACKENDS:
+        raise ValueError(f"后端 '{backend}' 不支持 int8 量化，可选: {', '.join(INT8_BACKENDS)}")
+    target = exported_path(weights, backend, int8)
+    if target == weights or is_fresh(target, weights):
+        return target
+
+    from ultralytics import YOLO
+
+    print(f"导出 {backend}{' int8' if int8 else ''} 模型到 '{target}'（仅首次或权重更新后执行）")
+    # dynamic 使导出模型接受任意批次大小（scheduler.py 的微批次推理需要）
+    export_kwargs = {"format": BACKENDS[backend][0], "imgsz": imgsz, "dynamic": True}
+    if int8:
+        export_kwargs.update(int8=True, data=data)
+    produced = str(YOLO(weights).export(**export_kwargs))
+    if os.path.abspath(produced) != os.path.abspath(target):
+        # ultralytics 的默认命名与缓存名不同时（如 int8 的 ONNX/OpenVINO 目录名），移动到缓存位置
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(produced, target)
+    return target
+
+
+def load_backend_model(weights, backend="pt", int8=False, data=calibration_data, imgsz=export_imgsz):
+    """按后端加载模型；返回的对象与 ultralytics.YOLO 接口相同（predict 输出相同的 Results）"""
+    from ultralytics import YOLO
+
+    path = export_model(weights, backend, int8, data, imgsz)
+    return YOLO(path) if backend == "pt" else YOLO(path, task="detect")
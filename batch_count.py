@@ -0,0 +1,142 @@
+import os
+import glob
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+from task import SteelCounter, DEFAULT_PARAMS, get_sift
+from result_cache import ResultCache
+from roi import ROI_MODES
+from count_results import RESULT_FORMATS, save_results
+from render import AsyncImageWriter, default_output_dir, default_format
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_input = os.getcwd()   # 默认输入（文件夹或图片路径）
+default_workers = os.cpu_count() or 1  # 默认进程数
+image_exts = (".bmp", ".png", ".jpg", ".jpeg")
+# --------------------------------------------------------------------------
+
+
+def collect_images(inputs):
+    """将文件夹/文件路径列表展开为图片路径列表（保持输入顺序）"""
+    image_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for ext in image_exts:
+                image_paths.extend(sorted(glob.glob(os.path.join(item, f"*{ext}"))))
+        elif os.path.isfile(item):
+            image_paths.append(item)
+        else:
+            print(f"警告：'{item}' 不存在，已跳过")
+    return image_paths
+
+
+def _init_worker(single_thread=True):
+    """工作进程初始化：限制OpenCV内部线程数，并预先创建第一次检测使用的SIFT检测器"""
+    if single_thread:
+        # 多进程并行时避免每个进程再各自开满线程导致争抢
+        cv2.setNumThreads(1)
+    get_sift(**DEFAULT_PARAMS["coarse_sift"])
+
+
+def count_image(image_path, save=False, output_dir=None, fmt=None, writer=None, **counter_kwargs):
+    """
+    对单张图片执行完整的四次检测，返回计数、检测结果（结构化数组）与耗时
+
+    不保存标记图时以精简模式运行，各阶段用完的图像立即释放（counter_kwargs 传给 SteelCounter）；
+    output_dir、fmt、writer 传给 SteelCounter.save
+    """
+    start = time.perf_counter()
+    result = {"path": image_path, "total": None, "counts": None, "scale": None, "detections": None, "error": None}
+    try:
+        counter = SteelCounter(image_path, slim=not save, **counter_kwargs)
+        counter.first_detection()
+        counter.second_detection()
+        counter.third_detection()
+        counter.fourth_detection()
+        counts = counter.counts
+        result["counts"] = counts
+        result["detections"] = counter.detections
+        result["total"] = sum(counts)
+        result["scale"] = counter.most_common_scale
+        if save:
+            counter.save(output_dir, fmt, writer)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(image_paths, workers=default_workers, save=False, output_dir=None, fmt=None, **counter_kwargs):
+    """
+    使用进程池批量计数，结果按输入顺序返回
+
+    Args:
+        image_paths (list): 图片路径列表
+        workers (int): 进程数，1 表示在当前进程中串行执行
+        save (bool): 是否保存标记结果图
+        output_dir (str): 结果图输出文件夹，None 使用 render.default_output_dir
+        fmt (str): 结果图格式（jpg / png / bmp），None 使用 render.default_format
+        counter_kwargs: 传给 SteelCounter 的参数（如 scale_method、target_scale）
+    """
+    worker = partial(count_image, save=save, output_dir=output_dir, fmt=fmt, **counter_kwargs)
+    start = time.perf_counter()
+    if workers <= 1:
+        _init_worker(single_thread=False)
+        if save:
+            # 串行时结果图交给后台线程编码写出，与下一张图片的计数并行
+            with AsyncImageWriter() as writer:
+                results = [worker(path, writer=writer) for path in image_paths]
+        else:
+            results = [worker(path) for path in image_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = list(executor.map(worker, image_paths))
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def print_report(results, elapsed):
+    """打印逐张耗时与整体吞吐量"""
+    for result in results:
+        name = os.path.basename(result["path"])
+        if result["error"]:
+            print(f"{name}: 出错（{result['error']}），耗时 {result['seconds']:.2f}s")
+        else:
+            print(f"{name}: 总计数 {result['total']}，耗时 {result['seconds']:.2f}s")
+
+    done = len(results)
+    if done == 0:
+        print("没有找到可处理的图片")
+        return
+    busy = sum(r["seconds"] for r in results)
+    print(f"共处理 {done} 张图片，总耗时 {elapsed:.2f}s，"
+          f"吞吐量 {done / elapsed:.2f} 张/秒，平均单张耗时 {busy / done:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="钢筋计数批量处理")
+    parser.add_argument("inputs", nargs="*", default=[default_input], help="图片文件夹或图片路径")
+    parser.add_argument("--workers", type=int, default=default_workers, help="进程数")
+    parser.add_argument("--save", action="store_true", help="保存标记结果图")
+    parser.add_argument("--output", default=None, help=f"结果图输出文件夹（默认 {default_output_dir}）")
+    parser.add_argument("--format", default=None, choices=["jpg", "png", "bmp"],
+                        help=f"结果图格式（默认 {default_format}）")
+    parser.add_argument("--scale-method", default="sift", help="尺度估计方法：sift / distance / autocorr")
+    parser.add_argument("--cache", default=None, help="中间结果缓存数据库路径（如 cache/results.sqlite），不指定则不缓存")
+    parser.add_argument("--roi", default=None, choices=ROI_MODES, help="只在钢筋捆区域内检测（mask：亮区范围，ratio：图像下部）")
+    parser.add_argument("--results", default=None,
+                        help=f"批量保存检测结果的文件路径（{' / '.join(RESULT_FORMATS)}），不指定则不保存")
+    parser.add_argument("--target-scale", type=float, default=None, help="归一化分辨率模式的目标钢材尺度（像素）")
+    args = parser.parse_args()
+
+    image_paths = collect_images(args.inputs)
+    cache = ResultCache(args.cache) if args.cache else None
+    results, elapsed = run_batch(image_paths, args.workers, args.save, args.output, args.format,
+                                 scale_method=args.scale_method, target_scale=args.target_scale, cache=cache, roi=args.roi)
+    print_report(results, elapsed)
+    if args.results:
+        save_results(args.results, [(os.path.basename(r["path"]), r["detections"]) for r in results if not r["error"]])
+        print(f"检测结果已保存到 '{args.results}'")
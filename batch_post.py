@@ -0,0 +1,152 @@
+import os
+import time
+import struct
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import post_progress
+from dedup import dedup_mask
+from label_store import LabelStore, open_label_source, parse_yolo_text, restore_precision
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+# 图片/标签/输出文件夹及筛选、去重、标记参数默认与 post_progress.py 相同
+default_workers = os.cpu_count() or 1  # 默认进程数
+chunk_size = 16                        # 每次分给工作进程的图片数（图片多而单张耗时短，批量分发减少进程间通信）
+# --------------------------------------------------------------------------
+
+
+def image_size(image_path):
+    """只读取文件头获取图片尺寸 (width, height)，BMP/PNG 直接解析，其他格式交给 PIL（同样只读文件头）"""
+    with open(image_path, "rb") as f:
+        header = f.read(26)
+    if header[:2] == b"BM" and len(header) >= 26:
+        dib_size = struct.unpack_from("<I", header, 14)[0]
+        if dib_size == 12:  # BITMAPCOREHEADER
+            return struct.unpack_from("<HH", header, 18)
+        width, height = struct.unpack_from("<ii", header, 18)
+        return width, abs(height)  # 高度为负表示自上而下存储
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+        return struct.unpack_from(">II", header, 16)
+    with Image.open(image_path) as img:
+        return img.size
+
+
+def load_centers(img_name, label_source):
+    """
+    读取一张图片的中心点（相对坐标），返回 (N, 2) float64 数组；没有标签时返回 None
+
+    label_source 为标签文件夹、标签库路径或 open_label_source 的结果（批量处理时预先解析一次）。
+    标签库按图片取出的是零拷贝视图，这里只把中心点两列还原为新的 float64 数组，结果与解析文本完全相同。
+    """
+    label_source = open_label_source(label_source)
+    if isinstance(label_source, LabelStore):
+        labels = label_source.get(img_name)
+        return None if labels is None else restore_precision(labels[:, 1:3])
+    txt_path = os.path.join(label_source, f"{img_name}.txt")
+    if not os.path.exists(txt_path):
+        return None
+    with open(txt_path, "r") as f:
+        return parse_yolo_text(f.read(), np.float64)[:, 1:3]
+
+
+def postprocess_centers(centers_rel, img_width, img_height, min_y=post_progress.min_y_ratio,
+                        threshold=post_progress.distance_threshold):
+    """
+    向量化的筛选、坐标转换与去重，结果与 post_progress 逐点处理完全一致
+
+    Args:
+        centers_rel: (N, 2) 相对坐标
+        img_width, img_height (int): 图片尺寸
+        min_y (float): 保留y中心坐标（相对值）>min_y 的点
+        threshold (float): 去重距离阈值（像素），距离 < 阈值视为过近
+
+    Returns:
+        (M, 2) int64 绝对像素坐标
+    """
+    centers = centers_rel[centers_rel[:, 1] > min_y]
+    # 与 int() 相同向零截断，再限制在图像范围内
+    centers_abs = np.trunc(centers * [img_width, img_height]).astype(np.int64)
+    np.clip(centers_abs, 0, [img_width - 1, img_height - 1], out=centers_abs)
+    return centers_abs[dedup_mask(centers_abs, threshold, inclusive=False)]
+
+
+def count_image(img_path, label_source, draw=False, output_dir=post_progress.output_dir):
+    """对单张图片的YOLO预测做后处理，返回计数与中心点；draw 为 False 时不解码图片像素"""
+    start = time.perf_counter()
+    img_name = os.path.splitext(os.path.basename(img_path))[0]
+    result = {"path": img_path, "total": None, "points": None, "error": None}
+    try:
+        centers_rel = load_centers(img_name, label_source)
+        if centers_rel is None:
+            raise FileNotFoundError(f"没有找到 '{img_name}' 的标签")
+        points = postprocess_centers(centers_rel, *image_size(img_path))
+        result["points"] = points
+        result["total"] = len(points)
+        if draw and len(points):
+            output_path = os.path.join(output_dir, f"{img_name}_marked.bmp")
+            post_progress.draw_marks(img_path, [tuple(p) for p in points.tolist()], output_path,
+                                     post_progress.dot_radius, post_progress.mark_color)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(image_paths, label_source, workers=default_workers, draw=False, output_dir=post_progress.output_dir):
+    """
+    使用进程池批量后处理，结果按输入顺序返回
+
+    Args:
+        image_paths (list): 图片路径列表
+        label_source (str): YOLO预测标签文件夹或标签库文件
+        workers (int): 进程数，1 表示在当前进程中串行执行
+        draw (bool): 是否保存标记图片（需要解码图片）
+        output_dir (str): 标记图片输出文件夹
+    """
+    if draw:
+        os.makedirs(output_dir, exist_ok=True)
+    # 只判断一次标签来源类型；LabelStore 传给工作进程时只传路径，每个进程打开一次
+    label_source = open_label_source(label_source)
+    worker = partial(count_image, label_source=label_source, draw=draw, output_dir=output_dir)
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [worker(path) for path in image_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(worker, image_paths, chunksize=chunk_size))
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def print_report(results, elapsed):
+    """打印逐张计数与整体吞吐量"""
+    for result in results:
+        name = os.path.basename(result["path"])
+        if result["error"]:
+            print(f"{name}: 出错（{result['error']}）")
+        else:
+            print(f"{name}: 计数 {result['total']}，耗时 {result['seconds'] * 1000:.1f}ms")
+
+    done = len(results)
+    if done == 0:
+        print("没有找到可处理的图片")
+        return
+    print(f"共处理 {done} 张图片，总耗时 {elapsed:.2f}s，吞吐量 {done / elapsed:.1f} 张/秒")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO预测结果批量后处理（筛选、去重、计数）")
+    parser.add_argument("--images", default=post_progress.img_dir, help="图片文件夹")
+    parser.add_argument("--labels", default=post_progress.label_dir, help="预测标签文件夹或标签库文件")
+    parser.add_argument("--workers", type=int, default=default_workers, help="进程数")
+    parser.add_argument("--draw", action="store_true", help="保存标记图片（默认只计数，不解码图片）")
+    parser.add_argument("--output", default=post_progress.output_dir, help="标记图片输出文件夹")
+    args = parser.parse_args()
+
+    image_paths = sorted(os.path.join(args.images, f) for f in os.listdir(args.images) if f.lower().endswith(".bmp"))
+    results, elapsed = run_batch(image_paths, args.labels, args.workers, args.draw, args.output)
+    print_report(results, elapsed)
@@ -0,0 +1,296 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+
+import numpy as np
+from PIL import Image
+
+import post_progress
+from engine import SteelCountEngine
+from predict_pipeline import load_model, count_result, weights_path, imgsz, conf
+from lazy_dataset import AugmentedSamples
+
+# -------------------------- 请在这里指定路径和参数 --------------------------
+base_dir = os.path.dirname(os.path.abspath(__file__))
+labeled_images_dir = os.path.join(base_dir, "images")    # 带真值标注的图片（.bmp）
+labeled_labels_dir = os.path.join(base_dir, "labels")    # 对应的YOLO真值标签
+task_dir = os.path.join(base_dir, "task")                # 无真值的样例帧（文件名含失败类型）
+pred_label_dir = os.path.join(base_dir, "runs/detect/predict/labels")  # YOLO预测标签（对应 task_dir）
+baseline_path = os.path.join(base_dir, "benchmarks/baseline.json")     # 基线文件
+failure_tags = ["缩进", "暗头", "漏记", "计数正常"]        # 样例帧文件名中的失败类型
+# 与基线比较时允许的精度退化幅度
+tolerances = {"count_mae": 1.0, "precision": 0.02, "recall": 0.02}
+# --------------------------------------------------------------------------
+
+
+def file_hash(path):
+    """图像文件内容哈希"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_ground_truth(label_path, width, height):
+    """读取真值框，返回中心点 (N, 2) 与匹配半径 (N,)（像素）"""
+    rows = []
+    with open(label_path, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) == 5:
+                rows.append([float(v) for v in parts])
+    return ground_truth_from_labels(np.array(rows, np.float64).reshape(-1, 5), width, height)
+
+
+def ground_truth_from_labels(labels, width, height):
+    """(N, 5) YOLO标签数组 -> 中心点 (N, 2) 与匹配半径 (N,)（像素）"""
+    boxes = labels[:, 1:]
+    centers = boxes[:, :2] * [width, height]
+    radii = np.maximum(boxes[:, 2] * width, boxes[:, 3] * height) / 2
+    return centers, radii
+
+
+def match_points(pred, gt, radii):
+    """按距离贪心一对一匹配：预测点落在真值框半径内即为命中，返回命中数"""
+    if len(pred) == 0 or len(gt) == 0:
+        return 0
+    dist = np.linalg.norm(pred[:, None, :] - gt[None, :, :], axis=2)
+    pi, gi = np.nonzero(dist <= radii[None, :])
+    order = np.argsort(dist[pi, gi], kind="stable")
+    used_pred, used_gt = set(), set()
+    for p, g in zip(pi[order], gi[order]):
+        if p not in used_pred and g not in used_gt:
+            used_pred.add(p)
+            used_gt.add(g)
+    return len(used_pred)
+
+
+def tag_of(name):
+    """从文件名中提取失败类型"""
+    tags = [tag for tag in failure_tags if tag in name]
+    return "+".join(tags) if tags else "其他"
+
+
+def classical_points(engine, image, name, repeat):
+    """运行传统SIFT计数（image 为图像字节或数组），返回检出点与每次耗时"""
+    latencies = []
+    for _ in range(repeat):
+        result = engine.count(image, name)
+        latencies.append(result.seconds)
+    return result.points[:, :2], latencies
+
+
+def yolo_post_points(label_path, image_path, repeat):
+    """对已有的YOLO预测标签运行 post_progress 的筛选、转换与去重，返回检出点与每次耗时"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        centers_rel = post_progress.read_yolo_centers(label_path)
+        with Image.open(image_path) as img:
+            width, height = img.size
+        centers = post_progress.filter_by_y(centers_rel, post_progress.min_y_ratio)
+        centers = post_progress.rel_to_abs(centers, width, height)
+        centers = post_progress.remove_close_points(centers, post_progress.distance_threshold)
+        latencies.append(time.perf_counter() - start)
+    return np.array(centers, np.float64).reshape(-1, 2), latencies
+
+
+def parse_backend(spec):
+    """后端说明 -> (后端, 是否 int8)，如 openvino-int8 -> ("openvino", True)"""
+    name, _, suffix = spec.partition("-")
+    return name, suffix == "int8"
+
+
+def yolo_model_points(model, image_path, repeat):
+    """用 YOLO 模型（任意后端）推理并在内存中后处理，返回检出点与每次耗时（含推理）"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = next(iter(model.predict(source=image_path, stream=True, verbose=False,
+                                         imgsz=imgsz, conf=conf)))
+        points = count_result(result)["points"]
+        latencies.append(time.perf_counter() - start)
+    return points.astype(np.float64), latencies
+
+
+def load_backends(specs):
+    """加载要比较的模型后端，无法加载的（缺少 ultralytics 或权重）给出提示并跳过"""
+    models = {}
+    for spec in specs:
+        try:
+            models[spec] = load_model(weights_path, *parse_backend(spec))
+        except (ImportError, OSError, ValueError) as e:
+            print(f"警告：无法加载后端 '{spec}'（{e}），已跳过")
+    return models
+
+
+def find_prediction(image_path, pred_index):
+    """按文件名或图像内容哈希查找对应的YOLO预测标签"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    label_path = os.path.join(pred_label_dir, f"{stem}.txt")
+    if os.path.exists(label_path):
+        return label_path
+    return pred_index.get(file_hash(image_path))
+
+
+def build_prediction_index():
+    """task_dir 中图像内容哈希 -> 预测标签路径（同一图像以不同文件名出现时也能匹配）"""
+    index = {}
+    for image_path in glob.glob(os.path.join(task_dir, "*.bmp")):
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        label_path = os.path.join(pred_label_dir, f"{stem}.txt")
+        if os.path.exists(label_path):
+            index[file_hash(image_path)] = label_path
+    return index
+
+
+def evaluate(records):
+    """汇总计数误差、点匹配精确率/召回率与耗时分位数"""
+    latencies = np.concatenate([r["latencies"] for r in records]) * 1000
+    summary = {
+        "images": len(records),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+    labeled = [r for r in records if "gt" in r]
+    if labeled:
+        tp = sum(r["tp"] for r in labeled)
+        n_pred = sum(r["count"] for r in labeled)
+        n_gt = sum(r["gt"] for r in labeled)
+        summary["count_mae"] = float(np.mean([abs(r["count"] - r["gt"]) for r in labeled]))
+        summary["precision"] = tp / n_pred if n_pred else 0.0
+        summary["recall"] = tp / n_gt if n_gt else 0.0
+    return summary
+
+
+def run_augmented(engine, details, repeat):
+    """在内存中对带标注图片做增强（与 add_more_sample 相同的变换），评估传统方法，不写出中间文件"""
+    samples = AugmentedSamples(labeled_images_dir, labeled_labels_dir, as_array=True)
+    records = details["classical"]["augmented"] = []
+    for index in range(len(samples)):
+        name = samples.sample_name(index)
+        image, labels = samples[index]
+        height, width = image.shape[:2]
+        points, latencies = classical_points(engine, image, name, repeat)
+        gt = ground_truth_from_labels(labels, width, height)
+        records.append({"name": name, "tag": name.rsplit("_", 1)[1], "count": len(points),
+                        "latencies": latencies, "gt": len(gt[0]), "tp": match_points(points, *gt)})
+
+
+def run_benchmark(repeat=1, scale_method="sift", augmented=False, backends=()):
+    """运行全部基准，返回 {方法: {数据集: 汇总}} 及逐图明细；backends 为要比较的 YOLO 推理后端"""
+    engine = SteelCountEngine(scale_method=scale_method)
+    models = load_backends(backends)
+    pred_index = build_prediction_index()
+    datasets = {
+        "labeled": sorted(glob.glob(os.path.join(labeled_images_dir, "*.bmp"))),
+        "task": sorted(glob.glob(os.path.join(task_dir, "*.bmp"))),
+    }
+    details = {"classical": {}, "yolo_post": {}}
+    details.update({f"yolo_{spec}": {} for spec in models})
+    for dataset, image_paths in datasets.items():
+        for method in details:
+            details[method][dataset] = []
+        for image_path in image_paths:
+            name = os.path.basename(image_path)
+            with Image.open(image_path) as img:
+                width, height = img.size
+            gt_path = os.path.join(labeled_labels_dir, os.path.splitext(name)[0] + ".txt")
+            gt = load_ground_truth(gt_path, width, height) if dataset == "labeled" and os.path.exists(gt_path) else None
+
+            with open(image_path, "rb") as f:
+                data = f.read()
+            runs = {"classical": classical_points(engine, data, name, repeat)}
+            label_path = find_prediction(image_path, pred_index)
+            if label_path:
+                runs["yolo_post"] = yolo_post_points(label_path, image_path, repeat)
+            for spec, model in models.items():
+                runs[f"yolo_{spec}"] = yolo_model_points(model, image_path, repeat)
+
+            for method, (points, latencies) in runs.items():
+                record = {"name": name, "tag": tag_of(name), "count": len(points), "latencies": latencies}
+                if gt is not None:
+                    record["gt"] = len(gt[0])
+                    record["tp"] = match_points(points, *gt)
+                details[method][dataset].append(record)
+    if augmented:
+        run_augmented(engine, details, repeat)
+
+    summary = {
+        method: {dataset: evaluate(records) for dataset, records in by_dataset.items() if records}
+        for method, by_dataset in details.items()
+    }
+    return summary, details
+
+
+def check_regressions(summary, baseline):
+    """与基线比较精度，返回退化项列表"""
+    problems = []
+    for method, by_dataset in baseline.get("summary", {}).items():
+        for dataset, base in by_dataset.items():
+            current = summary.get(method, {}).get(dataset)
+            if current is None:
+                continue
+            if "count_mae" in base and current["count_mae"] > base["count_mae"] + tolerances["count_mae"]:
+                problems.append(f"{method}/{dataset} 计数误差 {base['count_mae']:.2f} -> {current['count_mae']:.2f}")
+            for key in ("precision", "recall"):
+                if key in base and current[key] < base[key] - tolerances[key]:
+                    problems.append(f"{method}/{dataset} {key} {base[key]:.3f} -> {current[key]:.3f}")
+    return problems
+
+
+def print_report(summary, details):
+    """打印逐图结果与汇总"""
+    for method, by_dataset in details.items():
+        for dataset, records in by_dataset.items():
+            for r in records:
+                gt = f"，真值 {r['gt']}，命中 {r['tp']}" if "gt" in r else ""
+                print(f"[{method}/{dataset}] {r['name']}（{r['tag']}）: 计数 {r['count']}{gt}，"
+                      f"耗时 {np.median(r['latencies']) * 1000:.1f}ms")
+    print()
+    for method, by_dataset in summary.items():
+        for dataset, s in by_dataset.items():
+            accuracy = ""
+            if "count_mae" in s:
+                accuracy = (f"计数误差 {s['count_mae']:.2f}  精确率 {s['precision']:.3f}  "
+                            f"召回率 {s['recall']:.3f}  ")
+            print(f"{method:<18} {dataset:<9} {s['images']:>3} 张  {accuracy}"
+                  f"p50 {s['p50_ms']:.1f}ms  p95 {s['p95_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="钢筋计数精度与耗时基准")
+    parser.add_argument("--repeat", type=int, default=1, help="每张图片重复次数（用于耗时分位数）")
+    parser.add_argument("--scale-method", default="sift", help="传统方法的尺度估计方式")
+    parser.add_argument("--augmented", action="store_true", help="额外评估按需增强的带标注样本（不写出中间文件）")
+    parser.add_argument("--backends", default="",
+                        help="逗号分隔的 YOLO 推理后端，比较速度与计数精度，如 pt,onnx,openvino,openvino-int8")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果写为基线")
+    parser.add_argument("--check", action="store_true", help="与基线比较，精度退化时返回非零退出码")
+    args = parser.parse_args()
+
+    summary, details = run_benchmark(args.repeat, args.scale_method, args.augmented,
+                                     [spec for spec in args.backends.split(",") if spec])
+    print_report(summary, details)
+
+    if args.check:
+        if not os.path.exists(baseline_path):
+            print(f"错误：基线文件 '{baseline_path}' 不存在，请先使用 --save-baseline 生成")
+            sys.exit(1)
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = check_regressions(summary, baseline)
+        for problem in problems:
+            print(f"精度退化：{problem}")
+        if problems:
+            sys.exit(1)
+        print("与基线相比无精度退化")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"scale_method": args.scale_method, "repeat": args.repeat, "summary": summary},
+                      f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 '{baseline_path}'")
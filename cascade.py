@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from backends import BACKENDS
+from engine import SteelCountEngine
+from predict_pipeline import (ReplayModel, count_result, list_images, load_model, predict_images, weights_path,
+                              source_dir, imgsz, conf, backend, int8)
+from roi import ROI_MODES
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+log_path = "logs/cascade.jsonl"  # 逐张决策日志（JSONL），None 表示不记录
+min_confidence = 0.1     # 置信度低于该值的图片交给YOLO重新计数
+# 各信号的上限：信号达到上限时置信度降为 0（取值依据 task/ 中计数正常与漏记图片的对比）
+max_scale_spread = 0.15  # 第一次检测特征点尺度的相对离散度：尺度不统一时第二~四次检测的筛选不可靠
+max_residual = 0.15      # 检测完成后剩余亮区占初始亮区的比例：大量亮区未被覆盖说明有钢筋漏记
+max_extra_ratio = 0.25   # 第三、四次检测新增数量与第二次检测数量之比：补检过多说明主检测不可靠
+# --------------------------------------------------------------------------
+
+
+def confidence_signals(counter):
+    """从完成四次检测的 SteelCounter 中提取置信度信号"""
+    count2, count3, count4 = counter.counts
+    extra = count3 + count4
+    return {
+        "scale_spread": counter.scale_spread,
+        "residual": counter.residual_area / max(counter.bright_area, 1),
+        "extra_ratio": extra / max(count2, 1),
+    }
+
+
+def confidence_score(signals):
+    """
+    合成置信度：各信号按上限归一化后取最差的一项，1 表示完全可信，0 表示至少一项信号超限
+
+    尺度离散度只有 sift 尺度估计才有，其他方法时忽略该项。
+    """
+    limits = {"scale_spread": max_scale_spread, "residual": max_residual, "extra_ratio": max_extra_ratio}
+    scores = [1 - value / limits[name] for name, value in signals.items() if value is not None]
+    return float(np.clip(min(scores), 0, 1))
+
+
+class CascadeCounter:
+    """
+    级联计数：先用传统SIFT计数，只有置信度低的图片才调用YOLO模型
+
+    YOLO模型在第一次需要升级时才加载，全部图片都可信时不产生任何模型开销。
+
+    示例:
+        cascade = CascadeCounter(model_loader=lambda: load_model(weights_path))
+        counted = cascade.count("task/101113_0缩进.bmp")
+    """
+
+    def __init__(self, engine=None, model=None, model_loader=load_model, min_confidence=min_confidence,
+                 log_path=log_path, roi=None, **predict_kwargs):
+        """
+        Args:
+            engine (engine.SteelCountEngine): 传统计数引擎，None 时使用默认参数
+            model: ultralytics.YOLO 或 ReplayModel 等同接口对象，None 时在第一次升级时由 model_loader 创建
+            model_loader: 无参数的模型加载函数
+            min_confidence (float): 升级阈值
+            log_path (str): 决策日志路径（JSONL，追加写入），None 表示不记录
+            roi: 传统计数与YOLO推理都只处理钢筋捆区域（见 roi.py），engine 为 None 时生效于传统计数
+            predict_kwargs: 传给 model.predict 的参数（如 imgsz、conf）
+        """
+        self.engine = engine or SteelCountEngine(roi=roi, slim=True)
+        self.roi = roi
+        self.model = model
+        self.model_loader = model_loader
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        predict_kwargs.setdefault("imgsz", imgsz)
+        predict_kwargs.setdefault("conf", conf)
+        self.predict_kwargs = predict_kwargs
+        self.frames = 0
+        self.escalated = 0
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    def _predict(self, image_path):
+        if self.model is None:
+            self.model = self.model_loader()
+        results = predict_images(self.model, image_path, roi=self.roi, save=False, save_txt=False, verbose=False,
+                                 **self.predict_kwargs)
+        return count_result(next(results))
+
+    def _log(self, record):
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def count(self, image_path):
+        """
+        对单张图片级联计数
+
+        Returns:
+            dict: name、path、method（"sift" / "yolo"）、total、points（(M, 2) 原图坐标）、
+                confidence、signals、sift_total、seconds
+        """
+        start = time.perf_counter()
+        name = os.path.basename(image_path)
+        record = {"name": name, "path": image_path, "sift_total": None, "signals": None, "confidence": 0.0}
+        try:
+            with open(image_path, "rb") as f:
+                counter = self.engine.run(f.read(), name)
+            points = counter.keypoint_array()[:, :2]
+            record["sift_total"] = len(points)
+            record["signals"] = confidence_signals(counter)
+            record["confidence"] = confidence_score(record["signals"])
+        except ValueError as e:
+            # 没有亮区或特征点：传统方法无法计数，直接交给YOLO
+            record["error"] = str(e)
+
+        # 传统计数失败时无论阈值多少都交给YOLO（min_confidence 为 0 时也不例外）
+        if record["sift_total"] is None or record["confidence"] < self.min_confidence:
+            counted = self._predict(image_path)
+            record.update(method="yolo", total=counted["total"])
+            points = counted["points"]
+            self.escalated += 1
+        else:
+            record.update(method="sift", total=record["sift_total"])
+        self.frames += 1
+        record["seconds"] = time.perf_counter() - start
+        self._log(dict(record, time=time.time()))
+        return dict(record, points=points)
+
+    def report(self):
+        """打印升级比例"""
+        if self.frames:
+            print(f"共 {self.frames} 张，交给YOLO {self.escalated} 张（{self.escalated / self.frames:.0%}），"
+                  f"其余由传统计数完成")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="级联计数：传统SIFT计数置信度低时再调用YOLO")
+    parser.add_argument("--source", default=source_dir, help="图片文件夹或图片路径")
+    parser.add_argument("--weights", default=weights_path, help="模型权重路径")
+    parser.add_argument("--backend", default=backend, choices=list(BACKENDS), help="推理后端")
+    parser.add_argument("--int8", action="store_true", default=int8, help="使用 int8 量化模型（仅 openvino）")
+    parser.add_argument("--replay-labels", default=None, help="用已有的预测标签（文件夹或标签库）代替模型推理")
+    parser.add_argument("--min-confidence", type=float, default=min_confidence, help="升级到YOLO的置信度阈值")
+    parser.add_argument("--log", default=log_path, help="决策日志路径（JSONL）")
+    parser.add_argument("--roi", default=None, choices=ROI_MODES, help="只处理钢筋捆区域（mask：亮区范围，ratio：图像下部）")
+    args = parser.parse_args()
+
+    model = ReplayModel(args.replay_labels) if args.replay_labels else None
+    cascade = CascadeCounter(model=model, model_loader=lambda: load_model(args.weights, args.backend, args.int8),
+                             min_confidence=args.min_confidence, log_path=args.log, roi=args.roi)
+    for image_path in list_images(args.source):
+        counted = cascade.count(image_path)
+        sift_total = "失败" if counted["sift_total"] is None else counted["sift_total"]
+        print(f"{counted['name']}: 计数 {counted['total']}（{counted['method']}），传统计数 {sift_total}，"
+              f"置信度 {counted['confidence']:.2f}，耗时 {counted['seconds']:.2f}s")
+    cascade.report()
@@ -0,0 +1,83 @@
+import os
+import json
+
+import numpy as np
+
+# 单个检测结果：原图坐标、特征点直径、检测次数（2/3/4），每个 13 字节
+DETECTION_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("size", "<f4"), ("pass", "u1")])
+RESULT_FORMATS = (".npz", ".jsonl")
+
+
+def keypoints_to_detections(keypoints, pass_id):
+    """cv2.KeyPoint 列表 -> 检测结果结构化数组"""
+    detections = np.empty(len(keypoints), DETECTION_DTYPE)
+    if len(keypoints):
+        detections["x"], detections["y"], detections["size"] = np.array(
+            [(kp.pt[0], kp.pt[1], kp.size) for kp in keypoints], np.float32).T
+    detections["pass"] = pass_id
+    return detections
+
+
+def detections_to_array(detections):
+    """结构化数组 -> (N, 4) float32 数组 [x, y, size, pass]"""
+    return np.stack([detections[name].astype(np.float32) for name in DETECTION_DTYPE.names], axis=1).reshape(-1, 4)
+
+
+def save_npz(path, results):
+    """
+    批量保存为一个 .npz：所有图片的检测结果拼接成一个结构化数组，按 offsets 切分
+
+    Args:
+        results: (名称, 检测结果结构化数组) 序列
+    """
+    names, arrays = [], []
+    for name, detections in results:
+        names.append(name)
+        arrays.append(np.asarray(detections, DETECTION_DTYPE))
+    offsets = np.cumsum([0] + [len(a) for a in arrays], dtype=np.int64)
+    detections = np.concatenate(arrays) if arrays else np.empty(0, DETECTION_DTYPE)
+    np.savez(path, names=np.array(names, dtype=str), offsets=offsets, detections=detections)
+
+
+def load_npz(path):
+    """读取 save_npz 的结果，返回 {名称: 检测结果结构化数组}"""
+    with np.load(path) as data:
+        names, offsets, detections = data["names"], data["offsets"], data["detections"]
+    return {str(name): detections[offsets[i]:offsets[i + 1]] for i, name in enumerate(names)}
+
+
+def save_jsonl(path, results):
+    """批量保存为 JSONL：每张图片一行 {"name", "total", "counts", "points": [[x, y, size, pass], ...]}，数值保留两位小数"""
+    with open(path, "w", encoding="utf-8") as f:
+        for name, detections in results:
+            counts = [int(np.count_nonzero(detections["pass"] == p)) for p in (2, 3, 4)]
+            points = [[round(float(x), 2), round(float(y), 2), round(float(size), 2), int(p)]
+                      for x, y, size, p in detections.tolist()]
+            f.write(json.dumps({"name": name, "total": len(detections), "counts": counts, "points": points},
+                               ensure_ascii=False) + "\n")
+
+
+def load_jsonl(path):
+    """读取 save_jsonl 的结果，返回 {名称: 检测结果结构化数组}"""
+    results = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            results[record["name"]] = np.array([tuple(p) for p in record["points"]], DETECTION_DTYPE)
+    return results
+
+
+def save_results(path, results):
+    """按扩展名（.npz / .jsonl）批量保存"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        save_npz(path, results)
+    elif ext == ".jsonl":
+        save_jsonl(path, results)
+    else:
+        raise ValueError(f"不支持的结果格式 '{ext}'，可选: {', '.join(RESULT_FORMATS)}")
+
+
+def load_results(path):
+    """按扩展名读取批量结果"""
+    return load_npz(path) if path.lower().endswith(".npz") else load_jsonl(path)
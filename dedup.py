@@ -0,0 +1,123 @@
+import time
+import numpy as np
+
+# 9个相邻网格（含自身）的偏移
+_NEIGHBOR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def _close_pairs(coords, threshold, inclusive):
+    """基于均匀网格哈希找出所有距离过近的点对 (i, j)，且 i < j"""
+    n = len(coords)
+    cell_size = threshold if threshold > 0 else 1.0
+    cells = np.floor(coords / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0) - 1  # 留出一圈空网格，保证邻域键值不越界
+    width = int(cells[:, 1].max()) + 2
+    keys = cells[:, 0] * width + cells[:, 1]
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pairs_i = []
+    pairs_j = []
+    for dx, dy in _NEIGHBOR_OFFSETS:
+        neighbor_keys = keys + dx * width + dy
+        start = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        end = np.searchsorted(sorted_keys, neighbor_keys, side="right")
+        counts = end - start
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        # 展开每个点在邻域网格中的候选点
+        idx_i = np.repeat(np.arange(n), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        idx_j = order[np.repeat(start, counts) + within]
+
+        valid = idx_i < idx_j
+        idx_i = idx_i[valid]
+        idx_j = idx_j[valid]
+        dist_sq = np.sum((coords[idx_i] - coords[idx_j]) ** 2, axis=1)
+        close = dist_sq <= threshold ** 2 if inclusive else dist_sq < threshold ** 2
+        pairs_i.append(idx_i[close])
+        pairs_j.append(idx_j[close])
+
+    if not pairs_i:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def dedup_mask(coords, threshold, inclusive=True):
+    """
+    按出现顺序去除过近的点（先出现者保留），返回布尔保留掩码
+
+    Args:
+        coords: (N, 2) 坐标数组
+        threshold (float): 距离阈值（像素）
+        inclusive (bool): True 时距离 <= 阈值视为过近，False 时距离 < 阈值视为过近
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+
+    pairs_i, pairs_j = _close_pairs(coords, threshold, inclusive)
+    if len(pairs_i) == 0:
+        return keep
+
+    # 按 i 排序建立邻接表，只需顺序遍历存在近邻的点
+    order = np.lexsort((pairs_j, pairs_i))
+    pairs_i = pairs_i[order]
+    pairs_j = pairs_j[order]
+    heads, starts = np.unique(pairs_i, return_index=True)
+    ends = np.append(starts[1:], len(pairs_i))
+    for i, s, e in zip(heads.tolist(), starts.tolist(), ends.tolist()):
+        if keep[i]:
+            keep[pairs_j[s:e]] = False
+    return keep
+
+
+def remove_close_points(points, threshold, inclusive=True):
+    """去除过近的点（保留第一个出现的点），返回保留的点列表"""
+    if len(points) == 0:
+        return []
+    keep = dedup_mask(points, threshold, inclusive)
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _naive_dedup_mask(coords, threshold, inclusive=True):
+    """原始的逐点比较实现，仅用于基准测试对照"""
+    keep = np.zeros(len(coords), dtype=bool)
+    retained = []
+    for i, coord in enumerate(coords):
+        if retained:
+            dists = np.hypot(*(np.asarray(retained) - coord).T)
+            too_close = dists <= threshold if inclusive else dists < threshold
+            if too_close.any():
+                continue
+        keep[i] = True
+        retained.append(coord)
+    return keep
+
+
+# 基准测试：比较网格哈希与逐点比较在不同点数下的耗时
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    threshold = 15.0
+    print(f"{'点数':>8} {'网格哈希(ms)':>14} {'逐点比较(ms)':>14} {'保留点数':>8}")
+    for n in [100, 1000, 5000, 10000, 20000, 50000]:
+        # 点密度与实际钢筋端面接近：约每 threshold^2 面积一个点
+        side = np.sqrt(n) * threshold
+        coords = rng.uniform(0, side, size=(n, 2))
+
+        start = time.perf_counter()
+        keep = dedup_mask(coords, threshold)
+        grid_ms = (time.perf_counter() - start) * 1000
+
+        if n <= 10000:
+            start = time.perf_counter()
+            naive_keep = _naive_dedup_mask(coords, threshold)
+            naive_ms = f"{(time.perf_counter() - start) * 1000:.1f}"
+            assert np.array_equal(keep, naive_keep), "网格哈希结果与逐点比较不一致"
+        else:
+            naive_ms = "跳过"
+        print(f"{n:>8} {grid_ms:>14.1f} {naive_ms:>14} {int(keep.sum()):>8}")
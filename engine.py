@@ -0,0 +1,99 @@
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from task import SteelCounter, get_sift, merge_params
+
+# 单张图像的计数结果；points 为 (N, 4) 数组 [x, y, size, pass]，坐标为原图坐标
+CountResult = namedtuple("CountResult", ["name", "total", "counts", "scale", "points", "seconds"])
+
+
+def decode_image(image):
+    """将 ndarray（灰度/BGR/BGRA）或编码后的图像字节转换为灰度图"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("无法解码图像字节")
+        return gray
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image
+        if image.ndim == 3 and image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image.ndim == 3 and image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+        raise ValueError(f"不支持的图像形状: {image.shape}")
+    raise TypeError(f"不支持的图像类型: {type(image).__name__}")
+
+
+class SteelCountEngine:
+    """
+    可复用的钢筋计数引擎：一次配置，多次对内存中的图像调用
+
+    示例:
+        engine = SteelCountEngine(scale_method="distance", second_tolerance=0.35)
+        result = engine.count(image_bytes, name="frame_001")
+    """
+
+    def __init__(self, threshold_low=80, scale_method="sift", target_scale=None, restrict_to_blobs=True,
+                 profiler=None, cache=None, roi=None, slim=False, **params):
+        """
+        Args:
+            threshold_low (int): 亮度拉伸下限
+            scale_method (str): 尺度估计方法
+            target_scale (float): 归一化分辨率模式的目标尺度，None 表示原分辨率
+            restrict_to_blobs (bool): 第三、四次检测是否仅在剩余亮斑附近运行
+            profiler (profiling.StageProfiler): 可选的分阶段性能记录
+            cache (result_cache.ResultCache): 可选的中间结果缓存，重复图像或只改动部分参数时跳过未变的阶段
+            slim (bool): 精简模式，各阶段用完的图像立即释放，只保留结构化的检测结果（run 返回的计数器不能绘图）
+            roi: 检测区域，"mask"、"ratio" 或 (x0, y0, x1, y1)，None 表示整图（见 roi.py）
+            params: 覆盖 task.DEFAULT_PARAMS 中的检测参数
+        """
+        self.params = merge_params(params)
+        self.counter_kwargs = {
+            "threshold_low": threshold_low,
+            "scale_method": scale_method,
+            "target_scale": target_scale,
+            "restrict_to_blobs": restrict_to_blobs,
+            "params": self.params,
+            "profiler": profiler,
+            "cache": cache,
+            "roi": roi,
+            "slim": slim,
+        }
+        if scale_method == "sift":
+            # 预先创建第一次检测的SIFT检测器
+            get_sift(**self.params["coarse_sift"])
+
+    def run(self, image, name="", scale=None):
+        """执行四次检测并返回 SteelCounter（供需要中间结果的调用方使用）；scale 不为 None 时跳过尺度估计"""
+        counter = SteelCounter(name, image=decode_image(image), **self.counter_kwargs)
+        if scale is None:
+            counter.first_detection()
+        else:
+            counter.set_scale(scale)
+        counter.second_detection()
+        counter.third_detection()
+        counter.fourth_detection()
+        return counter
+
+    def count(self, image, name="", scale=None):
+        """对单张图像计数，返回 CountResult"""
+        start = time.perf_counter()
+        counter = self.run(image, name, scale)
+        counts = counter.counts
+        return CountResult(
+            name=name,
+            total=sum(counts),
+            counts=counts,
+            scale=counter.most_common_scale,
+            points=counter.keypoint_array(),
+            seconds=time.perf_counter() - start,
+        )
+
+    def count_many(self, images):
+        """对 (name, image) 序列逐个计数"""
+        for name, image in images:
+            yield self.count(image, name)
@@ -0,0 +1,192 @@
+import os
+import glob
+import time
+import struct
+import argparse
+
+import numpy as np
+
+# 文件布局（小端）：
+#   头部 32 字节：magic(4s) version(u4) 图片数 n(u8) 目标总数 m(u8) 名称区字节数(u8)
+#   偏移表 int64 (n + 1,)：第 i 张图片的标签为 data[offsets[i]:offsets[i + 1]]
+#   标签区 float32 (m, 5)：class_id, x_center, y_center, width, height（相对坐标）
+#   名称区 UTF-8：图片名（标签文件名去掉 .txt），以换行分隔
+MAGIC = b"STLB"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQ")
+STORE_SUFFIX = ".labels"  # 标签库文件的默认扩展名
+
+_OPEN_STORES = {}  # 进程内已打开的标签库：路径 -> ((修改时间, 大小), LabelStore)
+
+
+def is_label_store(path):
+    """判断路径是否为标签库文件（按文件头的 magic 判断，而不是标签文件夹或其他文件）"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def parse_yolo_text(text, dtype=np.float32):
+    """解析YOLO标签文本，跳过字段数不为5的行，返回 (N, 5) 数组"""
+    rows = [line for line in text.splitlines() if len(line.split()) == 5]
+    return np.array(" ".join(rows).split(), dtype).reshape(-1, 5)
+
+
+def restore_precision(values, digits=6):
+    """
+    将 float32 标签还原为文本中的 float64 值
+
+    YOLO 标签文本最多保留 6 位有效数字（%g 或 %.6f），float32 的精度足以无损区分，
+    按有效数字取整后与直接解析文本得到的 float64 完全相同，下游的取整、比较结果不变。
+    返回新的 float64 数组（会拷贝，读取时只对需要的列调用）。
+    """
+    values = np.asarray(values, np.float64)
+    magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.rint(values * scale) / scale
+
+
+def write_store(store_path, names, arrays):
+    """将 names 与对应的 (N, 5) 标签数组写为标签库（先写临时文件再替换，避免读到半个文件）"""
+    names = list(names)
+    arrays = [np.asarray(a, np.float32).reshape(-1, 5) for a in arrays]
+    if len(names) != len(arrays):
+        raise ValueError("名称数量与标签数组数量不一致")
+    if any("\n" in name for name in names):
+        raise ValueError("图片名中不能包含换行符")
+    offsets = np.zeros(len(arrays) + 1, np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    name_bytes = "\n".join(names).encode("utf-8")
+
+    tmp_path = store_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), int(offsets[-1]), len(name_bytes)))
+        f.write(offsets.astype("<i8").tobytes())
+        for a in arrays:
+            f.write(a.astype("<f4").tobytes())
+        f.write(name_bytes)
+    os.replace(tmp_path, store_path)
+
+
+class LabelStore:
+    """
+    只读的打包标签库：通过 numpy.memmap 访问，按图片取出的标签是文件映射上的切片（零拷贝）
+
+    示例:
+        store = LabelStore("steel_sample.labels")
+        labels = store["1_rot90"]      # (N, 5) float32，只读
+        centers = labels[:, 1:3]       # 仍然是零拷贝视图
+
+    需要与解析文本完全相同的 float64 值时再调用 restore_precision（会拷贝）。
+    可以 pickle：只传递路径，工作进程中按路径重新打开（进程内复用），不会拷贝整个文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, np.uint8, mode="r")
+        if len(self._buffer) < HEADER.size:
+            raise ValueError(f"'{path}' 不是有效的标签库文件")
+        magic, version, n_images, n_boxes, n_name_bytes = HEADER.unpack(self._buffer[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' 不是有效的标签库文件")
+        if version != VERSION:
+            raise ValueError(f"不支持的标签库版本 {version}")
+
+        offsets_start = HEADER.size
+        data_start = offsets_start + 8 * (n_images + 1)
+        names_start = data_start + 4 * 5 * n_boxes
+        if len(self._buffer) != names_start + n_name_bytes:
+            raise ValueError(f"标签库 '{path}' 文件长度不符，可能已损坏")
+        self.offsets = self._buffer[offsets_start:data_start].view("<i8")
+        self.data = self._buffer[data_start:names_start].view("<f4").reshape(-1, 5)
+        names = self._buffer[names_start:].tobytes().decode("utf-8")
+        self.names = names.split("\n") if n_images else []
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def __reduce__(self):
+        return open_label_store, (self.path,)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, key):
+        """按图片名或编号取标签，返回 (N, 5) float32 只读视图"""
+        i = self._index[key] if isinstance(key, str) else key
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def get(self, name, default=None):
+        return self[name] if name in self._index else default
+
+    def items(self):
+        for i, name in enumerate(self.names):
+            yield name, self[i]
+
+
+def open_label_store(path):
+    """打开标签库（进程内按路径复用，避免重复建立名称索引；文件被重写后重新打开）"""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _OPEN_STORES.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    store = LabelStore(path)
+    _OPEN_STORES[path] = (signature, store)
+    return store
+
+
+def open_label_source(label_source):
+    """
+    解析标签来源：标签库文件返回打开的 LabelStore，标签文件夹原样返回路径，已打开的 LabelStore 直接返回
+
+    批量处理时先调用一次，再把结果传给逐张读取的函数，避免每张图片都重新判断文件类型。
+    """
+    if isinstance(label_source, LabelStore):
+        return label_source
+    return open_label_store(label_source) if is_label_store(label_source) else label_source
+
+
+def pack_yolo_dir(label_dir, store_path):
+    """将YOLO标签文件夹（每图一个 .txt）打包为一个标签库文件，返回打包的图片数"""
+    label_files = sorted(glob.glob(os.path.join(label_dir, "*.txt")))
+    names, arrays = [], []
+    for label_path in label_files:
+        name = os.path.splitext(os.path.basename(label_path))[0]
+        if name == "classes":
+            continue  # 类别名文件，不是标签
+        with open(label_path, "r") as f:
+            arrays.append(parse_yolo_text(f.read()))
+        names.append(name)
+    write_store(store_path, names, arrays)
+    return len(names)
+
+
+def unpack_to_yolo_dir(store_path, label_dir):
+    """将标签库还原为YOLO标签文件夹，返回写出的文件数"""
+    from add_more_sample import write_yolo_labels
+
+    store = LabelStore(store_path)
+    os.makedirs(label_dir, exist_ok=True)
+    for name, labels in store.items():
+        write_yolo_labels(os.path.join(label_dir, f"{name}.txt"), restore_precision(labels))
+    return len(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO标签文件夹与打包标签库之间的转换")
+    parser.add_argument("action", choices=["pack", "unpack"], help="pack: 文件夹 -> 标签库；unpack: 标签库 -> 文件夹")
+    parser.add_argument("label_dir", help="YOLO标签文件夹")
+    parser.add_argument("store_path", help=f"标签库文件路径（如 steel_sample{STORE_SUFFIX}）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.action == "pack":
+        count = pack_yolo_dir(args.label_dir, args.store_path)
+        print(f"已将 {count} 个标签文件打包到 '{args.store_path}'")
+    else:
+        count = unpack_to_yolo_dir(args.store_path, args.label_dir)
+        print(f"已从 '{args.store_path}' 还原 {count} 个标签文件到 '{args.label_dir}'")
+    print(f"耗时 {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,144 @@
+import os
+import glob
+import random
+import argparse
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from add_more_sample import TRANSFORMS, read_labels, has_labels
+from label_store import open_label_source
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_cache_size = 4  # 解码后原图的缓存数量（按最近使用淘汰），0 表示不缓存
+image_exts = (".bmp", ".png", ".jpg", ".jpeg")
+# --------------------------------------------------------------------------
+
+
+class AugmentedSamples:
+    """
+    按需生成增强样本的数据集：在内存中对原图应用 add_more_sample.TRANSFORMS，不写出中间文件
+
+    样本按“原图 × 变换”编号，同一原图的各变换编号相邻，顺序遍历时每张原图只解码一次。
+    支持 len() 与下标访问，可直接作为 map 式数据集交给训练循环（如 torch DataLoader）使用。
+
+    示例:
+        samples = AugmentedSamples("base_dir/images", "base_dir/labels")
+        for image, labels in samples:
+            ...
+    """
+
+    def __init__(self, images_dir, labels_dir, transforms=TRANSFORMS, cache_size=default_cache_size,
+                 as_array=False):
+        """
+        Args:
+            images_dir (str): 原始图片文件夹
+            labels_dir (str): 对应的YOLO标签文件夹或标签库文件（无标签的图片会被跳过）
+            transforms (list): (后缀, 变换函数, 参数) 列表，默认与 add_more_sample 相同
+            cache_size (int): 解码后原图的LRU缓存数量
+            as_array (bool): 为 True 时图像以 uint8 数组返回，否则返回 PIL 图像
+        """
+        self.transforms = list(transforms)
+        self.cache_size = cache_size
+        self.as_array = as_array
+        self.labels_dir = open_label_source(labels_dir)  # 只判断一次是标签文件夹还是标签库
+        self.sources = []
+        image_files = sorted(f for ext in image_exts for f in glob.glob(os.path.join(images_dir, f"*{ext}")))
+        for image_path in image_files:
+            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            if has_labels(self.labels_dir, base_name):
+                self.sources.append((base_name, image_path))
+            else:
+                print(f"警告: 未找到 '{base_name}' 的标签，跳过该图片")
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.sources) * len(self.transforms)
+
+    def _locate(self, index):
+        """样本编号 -> (原图编号, 变换编号)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"样本编号 {index} 超出范围")
+        return divmod(index, len(self.transforms))
+
+    def _load_source(self, source_index):
+        """读取并解码原图与标签（带LRU缓存）"""
+        cached = self._cache.get(source_index)
+        if cached is not None:
+            self._cache.move_to_end(source_index)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        base_name, image_path = self.sources[source_index]
+        with Image.open(image_path) as f:
+            image = f.copy()
+        loaded = (image, read_labels(self.labels_dir, base_name))
+        if self.cache_size > 0:
+            self._cache[source_index] = loaded
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return loaded
+
+    def sample_name(self, index):
+        """样本名称，与 add_more_sample 输出的文件名一致（不含扩展名）"""
+        source_index, transform_index = self._locate(index)
+        return f"{self.sources[source_index][0]}_{self.transforms[transform_index][0]}"
+
+    def __getitem__(self, index):
+        """返回 (image, labels)，labels 为 (N, 5) 数组 [class_id, x, y, w, h]（相对坐标）"""
+        source_index, transform_index = self._locate(index)
+        image, labels = self._load_source(source_index)
+        _, transform, kwargs = self.transforms[transform_index]
+        out_img, out_labels = transform(image, labels, **kwargs)
+        if self.as_array:
+            out_img = np.asarray(out_img)
+        return out_img, out_labels
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_shuffled(self, seed=0):
+        """
+        打乱顺序遍历：先打乱原图顺序，再在每张原图内部打乱变换顺序
+
+        同一原图的变换仍连续生成，缓存只需容纳一张原图即可避免重复解码。
+
+        Yields:
+            (name, image, labels)
+        """
+        rng = random.Random(seed)
+        source_order = list(range(len(self.sources)))
+        rng.shuffle(source_order)
+        for source_index in source_order:
+            transform_order = list(range(len(self.transforms)))
+            rng.shuffle(transform_order)
+            for transform_index in transform_order:
+                index = source_index * len(self.transforms) + transform_index
+                image, labels = self[index]
+                yield self.sample_name(index), image, labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按需生成增强样本（不写出中间文件）")
+    parser.add_argument("images_dir", help="原始图片文件夹")
+    parser.add_argument("labels_dir", help="原始标签文件夹或标签库文件")
+    parser.add_argument("--cache-size", type=int, default=default_cache_size, help="原图LRU缓存数量")
+    args = parser.parse_args()
+
+    samples = AugmentedSamples(args.images_dir, args.labels_dir, cache_size=args.cache_size)
+    start = time.perf_counter()
+    n_boxes = 0
+    for index in range(len(samples)):
+        image, labels = samples[index]
+        n_boxes += len(labels)
+        print(f"{samples.sample_name(index)}: {image.size[0]}x{image.size[1]}，{len(labels)} 个目标")
+    elapsed = time.perf_counter() - start
+    print(f"共 {len(samples)} 个样本、{n_boxes} 个目标，耗时 {elapsed:.2f}s，"
+          f"原图解码 {samples.misses} 次（缓存命中 {samples.hits} 次）")
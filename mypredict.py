@@ -1,14 +1,26 @@
-from ultralytics import YOLO
 import os
+import glob
+from backends import load_backend_model
 
 base_dir = 'base_dir' # 根目录路径
-model = YOLO(os.path.join(base_dir, 'runs/detect/train/weights/best.pt'))
-model.predict(
-    source=os.path.join(base_dir, 'task'),
-    imgsz=640,
-    save=True,
-    conf=0.35,
-    show_labels=False,
-    line_width=1,
-    save_txt=True
-    )  
\ No newline at end of file
+use_scheduler = False # True 时使用 scheduler.py 的微批次调度推理并直接输出计数（不保存预测图与标签）
+backend = 'pt'        # 推理后端：pt / onnx / openvino，导出结果缓存在权重旁（见 backends.py）
+int8 = False          # 是否使用 int8 量化模型（仅 openvino，以 steel.yaml 的 val 划分校准）
+model = load_backend_model(os.path.join(base_dir, 'runs/detect/train/weights/best.pt'), backend, int8,
+                           data=os.path.join(base_dir, 'steel.yaml'))
+if use_scheduler:
+    from scheduler import MicroBatchScheduler
+    scheduler = MicroBatchScheduler(model, max_batch=8, max_wait=0.05, p95_bound=None, conf=0.35)
+    for counted in scheduler.run(sorted(glob.glob(os.path.join(base_dir, 'task', '*.bmp')))):
+        print(f"{counted['name']}: 计数 {counted['total']}")
+    scheduler.report()
+else:
+    model.predict(
+        source=os.path.join(base_dir, 'task'),
+        imgsz=640,
+        save=True,
+        conf=0.35,
+        show_labels=False,
+        line_width=1,
+        save_txt=True
+        )
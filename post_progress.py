@@ -1,27 +1,23 @@
 import os
-import math
-from PIL import Image, ImageDraw
+import numpy as np
+from PIL import Image
+import dedup
+from render import AsyncImageWriter, read_image, stamp
+from label_store import LabelStore, open_label_source, restore_precision
+from profiling import StageProfiler, NULL_PROFILER
 
 # -------------------------- 请在这里指定文件夹路径和参数 --------------------------
 base_dir = "base_dir"
 img_dir = os.path.join(base_dir, "task")       # 图片文件夹（存放.bmp文件）
-label_dir = os.path.join(base_dir, "runs/detect/predict/labels")     # 标签文件夹（存放.txt文件）
+label_dir = os.path.join(base_dir, "runs/detect/predict/labels")     # 标签文件夹（存放.txt文件），也可以是 label_store.py 打包的标签库文件
 output_dir = os.path.join(base_dir, "results")    # 输出文件夹（保存标记后的图片）
 distance_threshold = 20  # 点之间的距离阈值（像素），小于此值视为"过于接近"
 dot_radius = 5           # 彩色圆点的半径（像素）
 min_y_ratio = 0.5        # 保留y中心坐标>此值的点（相对值，0.5即图像下半部分）
 mark_color = (255, 0, 0) # 标记点颜色（RGB格式，这里用红色，可修改为其他彩色）
+profile_path = None      # 性能记录输出路径（.jsonl 或 .prom），None 表示不记录
 # --------------------------------------------------------------------------------
 
-# 检查输入文件夹是否存在
-for dir_path in [img_dir, label_dir]:
-    if not os.path.exists(dir_path):
-        print(f"错误：文件夹 '{dir_path}' 不存在，请检查路径")
-        exit(1)
-
-# 创建输出文件夹
-os.makedirs(output_dir, exist_ok=True)
-
 def read_yolo_centers(txt_path):
     """读取YOLO标签文件，提取中心点坐标（相对值）"""
     centers = []
@@ -37,6 +33,21 @@ def read_yolo_centers(txt_path):
                 centers.append((x_rel, y_rel))
     return centers
 
+def read_centers(img_name, label_source=None):
+    """
+    从标签文件夹或标签库读取中心点（相对坐标）；标签库只取出 (N, 2) 中心点列，不解析文本
+
+    label_source 默认为 label_dir；批量处理时传入 open_label_source 的结果，避免每张图片重新判断类型
+    """
+    label_source = open_label_source(label_dir if label_source is None else label_source)
+    if isinstance(label_source, LabelStore):
+        labels = label_source.get(img_name)
+        if labels is None:
+            print(f"警告：标签库中没有 '{img_name}' 的标签，跳过对应图片")
+            return []
+        return restore_precision(labels[:, 1:3])
+    return read_yolo_centers(os.path.join(label_source, f"{img_name}.txt"))
+
 def filter_by_y(centers_rel, min_y):
     """筛选出y中心坐标（相对值）>min_y的点（仅保留下半部分）"""
     return [ (x, y) for x, y in centers_rel if y > min_y ]
@@ -55,49 +66,46 @@ def rel_to_abs(centers_rel, img_width, img_height):
 
 def remove_close_points(centers_abs, threshold):
     """去除距离过近的点（保留第一个出现的点）"""
-    kept = []
-    for point in centers_abs:
-        too_close = False
-        for kept_point in kept:
-            distance = math.hypot(point[0] - kept_point[0], point[1] - kept_point[1])
-            if distance < threshold:
-                too_close = True
-                break
-        if not too_close:
-            kept.append(point)
-    return kept
-
-def draw_marks(img_path, centers_abs, output_path, radius, color):
-    """在原图副本上用彩色圆点标记中心点（确保彩色显示）"""
+    return dedup.remove_close_points(centers_abs, threshold, inclusive=False)
+
+def mark_image(img, centers_abs, radius, color):
+    """返回用彩色圆点标记了中心点的图片副本（PIL 图像）"""
+    # 无论原图是灰度还是彩色，都转换为RGB模式以支持彩色标记
+    if img.mode not in ['RGB', 'RGBA']:
+        img = img.convert('RGB')
+    pixels = np.array(img)
+    fill = tuple(color) + (255,) if img.mode == 'RGBA' else color
+
+    # 用指定彩色一次性标记所有点（与逐点 ImageDraw.ellipse 的像素相同）
+    stamp(pixels, centers_abs, radius, fill, style="pil")
+    return Image.fromarray(pixels, img.mode)
+
+def draw_marks(img_path, centers_abs, output_path, radius, color, writer=None):
+    """在原图副本上用彩色圆点标记中心点（确保彩色显示）；传入 render.AsyncImageWriter 时由后台线程写出"""
     try:
-        with Image.open(img_path) as img:
-            # 无论原图是灰度还是彩色，都转换为RGB模式以支持彩色标记
-            if img.mode not in ['RGB', 'RGBA']:
-                img = img.convert('RGB')
-            img_copy = img.copy()
-            draw = ImageDraw.Draw(img_copy)
-            
-            # 用指定彩色标记每个点
-            for (x, y) in centers_abs:
-                draw.ellipse(
-                    [x - radius, y - radius, x + radius, y + radius],
-                    fill=color
-                )
-            img_copy.save(output_path)
-            print(f"已保存标记图片：{output_path}")
+        if writer is None:
+            with Image.open(img_path) as img:
+                mark_image(img, centers_abs, radius, color).save(output_path)
+                print(f"已保存标记图片：{output_path}")
+        else:
+            # 后台写出使用 BGR 数组，颜色按 BGR 顺序
+            marked = stamp(read_image(img_path), centers_abs, radius, tuple(color)[::-1], style="pil")
+            writer.submit(output_path, marked)
+            print(f"已提交标记图片：{output_path}")
     except Exception as e:
         print(f"处理图片 '{img_path}' 出错：{e}")
 
-def process_image(img_file):
-    """处理单张图片及对应标签"""
+def process_image(img_file, profiler=NULL_PROFILER, writer=None, label_source=None):
+    """处理单张图片及对应标签（label_source 见 read_centers）"""
     img_name = os.path.splitext(img_file)[0]
     img_path = os.path.join(img_dir, img_file)
-    txt_path = os.path.join(label_dir, f"{img_name}.txt")
     output_path = os.path.join(output_dir, f"{img_name}_marked.bmp")
 
     # 1. 读取标签中心点（相对坐标）
-    centers_rel = read_yolo_centers(txt_path)
-    if not centers_rel:
+    with profiler.stage("read", image=img_file) as record:
+        centers_rel = read_centers(img_name, label_source)
+        record["kp_out"] = len(centers_rel)
+    if len(centers_rel) == 0:
         return
 
     # 2. 打开图片获取尺寸
@@ -105,7 +113,10 @@ def process_image(img_file):
         img_width, img_height = img.size
 
     # 3. 筛选y中心坐标>0.5的点（仅保留下半部分）
-    filtered_by_y = filter_by_y(centers_rel, min_y_ratio)
+    with profiler.stage("filter", image=img_file) as record:
+        filtered_by_y = filter_by_y(centers_rel, min_y_ratio)
+        record["kp_in"] = len(centers_rel)
+        record["kp_out"] = len(filtered_by_y)
     if not filtered_by_y:
         print(f"图片 '{img_file}' 筛选后无符合条件的点（下半部分无点），跳过标记")
         return
@@ -114,18 +125,46 @@ def process_image(img_file):
     centers_abs = rel_to_abs(filtered_by_y, img_width, img_height)
 
     # 5. 去除距离过近的点
-    final_centers = remove_close_points(centers_abs, distance_threshold)
+    with profiler.stage("dedup", image=img_file) as record:
+        final_centers = remove_close_points(centers_abs, distance_threshold)
+        record["kp_in"] = len(centers_abs)
+        record["kp_out"] = len(final_centers)
     if not final_centers:
         print(f"图片 '{img_file}' 去重后无剩余点，跳过标记")
         return
 
     # 6. 用彩色标记并保存图片
-    draw_marks(img_path, final_centers, output_path, dot_radius, mark_color)
-
-# 批量处理所有bmp图片
-for img_file in os.listdir(img_dir):
-    if img_file.lower().endswith(".bmp"):
-        print(f"处理图片：{img_file}")
-        process_image(img_file)
-
-print(f"所有图片处理完成，标记后的图片保存在 '{output_dir}' 文件夹中")
\ No newline at end of file
+    with profiler.stage("draw", image=img_file):
+        draw_marks(img_path, final_centers, output_path, dot_radius, mark_color, writer)
+
+
+if __name__ == "__main__":
+    # 检查输入文件夹是否存在
+    for dir_path in [img_dir, label_dir]:
+        if not os.path.exists(dir_path):
+            print(f"错误：文件夹 '{dir_path}' 不存在，请检查路径")
+            exit(1)
+
+    # 创建输出文件夹
+    os.makedirs(output_dir, exist_ok=True)
+
+    profiler = StageProfiler() if profile_path else NULL_PROFILER
+
+    # 批量处理所有bmp图片（标记图由后台线程编码写出）
+    label_source = open_label_source(label_dir)
+    with AsyncImageWriter() as writer:
+        for img_file in os.listdir(img_dir):
+            if img_file.lower().endswith(".bmp"):
+                print(f"处理图片：{img_file}")
+                process_image(img_file, profiler, writer, label_source)
+    profiler.close()
+
+    print(f"所有图片处理完成，标记后的图片保存在 '{output_dir}' 文件夹中")
+
+    if profile_path:
+        if profile_path.endswith(".prom"):
+            with open(profile_path, "w", encoding="utf-8") as f:
+                f.write(profiler.to_prometheus())
+        else:
+            profiler.to_jsonl(profile_path)
+        profiler.summary()
@@ -0,0 +1,279 @@
+import os
+import glob
+import time
+import hashlib
+import argparse
+
+import cv2
+import numpy as np
+
+import post_progress
+from backends import BACKENDS, load_backend_model
+from batch_post import image_size, load_centers, postprocess_centers
+from label_store import open_label_source
+from result_cache import ResultCache, file_digest, stage_key
+from roi import ROI_MODES, find_roi, roi_to_image_xywhn
+from render import AsyncImageWriter, stamp, write_image
+
+# -------------------------- 请在这里指定路径和参数 --------------------------
+base_dir = "base_dir"  # 根目录路径
+weights_path = os.path.join(base_dir, "runs/detect/train/weights/best.pt")  # 训练好的模型
+source_dir = os.path.join(base_dir, "task")        # 待计数图片文件夹
+output_dir = os.path.join(base_dir, "results")     # 标记图片输出文件夹
+imgsz = 640     # 推理尺寸
+conf = 0.35     # 置信度阈值
+backend = "pt"  # 推理后端：pt / onnx / openvino（导出结果缓存在权重旁，见 backends.py）
+int8 = False    # 是否使用 int8 量化模型（仅 openvino）
+image_exts = (".bmp", ".png", ".jpg", ".jpeg")
+# 筛选、去重与标记参数（min_y_ratio、distance_threshold、dot_radius、mark_color）与 post_progress.py 相同
+# --------------------------------------------------------------------------
+
+
+def to_numpy(values):
+    """把预测结果中的张量（torch.Tensor）或数组统一转换为 float64 的 numpy 数组"""
+    if hasattr(values, "cpu"):
+        values = values.cpu().numpy()
+    return np.asarray(values, np.float64)
+
+
+class ReplayResult:
+    """与 ultralytics Results 相同接口的单帧结果：path、orig_shape、orig_img、boxes.xywhn"""
+
+    class Boxes:
+        def __init__(self, xywhn):
+            self.xywhn = xywhn
+
+    def __init__(self, path, xywhn, orig_img=None):
+        self.path = path
+        self._orig_img = orig_img
+        if orig_img is None:
+            width, height = image_size(path)
+            self.orig_shape = (height, width)
+        else:
+            self.orig_shape = orig_img.shape[:2]
+        self.boxes = self.Boxes(xywhn)
+
+    @property
+    def orig_img(self):
+        """按需解码（BGR），只计数时不读取像素"""
+        if self._orig_img is None:
+            return cv2.imread(self.path, cv2.IMREAD_COLOR)
+        return self._orig_img
+
+
+class ReplayModel:
+    """
+    本地替身模型：把已有的YOLO标签（文件夹或标签库）当作预测结果回放
+
+    与 ultralytics.YOLO 的 predict(source, stream=True, ...) 调用方式相同，
+    用于在没有模型权重或 GPU 的环境中测试流水线，也可以复现以前的预测结果。
+    """
+
+    def __init__(self, label_source):
+        self.label_source = open_label_source(label_source)
+
+    def predict(self, source, stream=True, **kwargs):
+        for path in list_images(source):
+            centers = load_centers(os.path.splitext(os.path.basename(path))[0], self.label_source)
+            xywhn = np.zeros((0, 4)) if centers is None else np.pad(centers, ((0, 0), (0, 2)))
+            yield ReplayResult(path, xywhn)
+
+
+def list_images(source):
+    """单张图片路径或图片文件夹 -> 排序后的图片路径列表"""
+    if os.path.isfile(source):
+        return [source]
+    return sorted(f for ext in image_exts for f in glob.glob(os.path.join(source, f"*{ext}")))
+
+
+def model_cache_key(weights=weights_path, backend=backend, int8=int8):
+    """模型身份（参与预测缓存键）：权重路径与修改时间、后端、是否量化，权重重新训练后缓存自动失效"""
+    mtime = os.path.getmtime(weights) if os.path.exists(weights) else None
+    return {"weights": os.path.abspath(weights), "mtime": mtime, "backend": backend, "int8": int8}
+
+
+def replay_cache_key(label_source):
+    """
+    回放模型身份（参与预测缓存键）：标签来源路径与其版本，标签重新生成后缓存自动失效
+
+    标签库文件以修改时间与大小为版本；标签文件夹以其中各 .txt 文件名、修改时间与大小的哈希为版本。
+    """
+    path = os.path.abspath(label_source)
+    if os.path.isdir(path):
+        digest = hashlib.sha1()
+        with os.scandir(path) as entries:
+            for entry in sorted((e for e in entries if e.is_file() and e.name.endswith(".txt")), key=lambda e: e.name):
+                stat = entry.stat()
+                digest.update(f"{entry.name}:{stat.st_mtime_ns}:{stat.st_size}\n".encode("utf-8"))
+        version = digest.hexdigest()
+    else:
+        stat = os.stat(path)
+        version = f"{stat.st_mtime_ns}:{stat.st_size}"
+    return {"replay": path, "version": version}
+
+
+def roi_predict(model, image_path, roi, **predict_kwargs):
+    """
+    只对 ROI 裁剪图推理，返回整图归一化坐标的预测框 (N, 4) xywhn 与解码后的整图（BGR）
+
+    Args:
+        roi: "mask"、"ratio" 或 (x0, y0, x1, y1)，见 roi.find_roi
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"无法读取图片 '{image_path}'")
+    box = find_roi(roi, gray=cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    x0, y0, x1, y1 = box
+    crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+    result = next(iter(model.predict(source=crop, stream=True, **predict_kwargs)))
+    return roi_to_image_xywhn(to_numpy(result.boxes.xywhn), box, image.shape), image
+
+
+def predict_images(model, source, cache=None, model_key=None, roi=None, **predict_kwargs):
+    """
+    逐张推理，支持预测结果缓存与 ROI 裁剪
+
+    缓存以图片内容哈希+模型身份+推理参数（含 roi）为键保存整图坐标的原始预测框（xywhn），
+    命中时直接回放，不再运行模型；只调整后处理参数重跑时全部命中。
+
+    Yields:
+        ultralytics Results（不缓存也不裁剪时）或 ReplayResult
+    """
+    for path in list_images(source):
+        key = None
+        if cache is not None:
+            key = stage_key(file_digest(path), "yolo_predict", dict(model_key or {}, roi=roi, **predict_kwargs))
+            xywhn = cache.get(key)
+            if xywhn is not None:
+                yield ReplayResult(path, xywhn)
+                continue
+        # 回放的标签本身就是整图预测结果，不做裁剪
+        if roi is not None and not isinstance(model, ReplayModel):
+            xywhn, image = roi_predict(model, path, roi, **predict_kwargs)
+            result = ReplayResult(path, xywhn, image)
+        else:
+            result = next(iter(model.predict(source=path, stream=True, **predict_kwargs)))
+        if key is not None:
+            cache.put(key, to_numpy(result.boxes.xywhn).reshape(-1, 4), "yolo_predict")
+        yield result
+
+
+def load_model(weights=weights_path, backend=backend, int8=int8):
+    """加载YOLO模型（仅在真正推理时才导入 ultralytics）；非 pt 后端首次使用时自动导出"""
+    return load_backend_model(weights, backend, int8, imgsz=imgsz)
+
+
+def is_frame_source(source):
+    """source 是否为视频、视频流或摄像头（各帧 path 相同），而不是图片、图片文件夹或图片列表"""
+    if isinstance(source, (list, tuple)):
+        return False
+    source = str(source)
+    return not (os.path.isdir(source) or source.lower().endswith(image_exts))
+
+
+def count_result(result, draw=False, output_dir=output_dir, writer=None, frame=None):
+    """
+    对单帧预测结果在内存中完成筛选、坐标转换与去重
+
+    Args:
+        result: ultralytics Results（或同接口对象），需提供 path、orig_shape、boxes.xywhn，
+            draw 为 True 时还需 orig_img（BGR）
+        draw (bool): 是否保存标记图片
+        output_dir (str): 标记图片输出文件夹
+        writer (render.AsyncImageWriter): 传入时标记图片交给后台线程写出
+        frame (int): 视频帧号；各帧 path 相同，指定时名称为 "<文件名>_<帧号>"，标记图片不会互相覆盖
+
+    Returns:
+        dict: name、path、total、points（(M, 2) 绝对像素坐标）
+    """
+    height, width = result.orig_shape[:2]
+    centers_rel = to_numpy(result.boxes.xywhn).reshape(-1, 4)[:, :2]
+    points = postprocess_centers(centers_rel, width, height)
+    name = os.path.basename(result.path)
+    stem = os.path.splitext(name)[0]
+    if frame is not None:
+        stem = name = f"{stem}_{frame:06d}"
+    if draw and len(points):
+        # 与 post_progress.mark_image 的像素相同；orig_img 为 BGR，颜色按 BGR 顺序
+        marked = stamp(result.orig_img.copy(), points, post_progress.dot_radius,
+                       tuple(post_progress.mark_color)[::-1], style="pil")
+        path = os.path.join(output_dir, f"{stem}_marked.bmp")
+        if writer is not None:
+            writer.submit(path, marked)
+        else:
+            write_image(path, marked)
+    return {"name": name, "path": result.path, "total": len(points), "points": points}
+
+
+def run_pipeline(model, source=source_dir, draw=False, output_dir=output_dir, cache=None, model_key=None,
+                 roi=None, **predict_kwargs):
+    """
+    推理与后处理流水线：以 stream=True 逐帧取出预测结果，不写出预测标签与预测图
+
+    Args:
+        model: ultralytics.YOLO 或 ReplayModel 等同接口对象
+        source (str): 图片文件夹、视频等（与 model.predict 的 source 相同）
+        draw (bool): 是否保存标记图片
+        output_dir (str): 标记图片输出文件夹
+        cache (result_cache.ResultCache): 可选的预测结果缓存（source 需为图片或图片文件夹）
+        model_key (dict): 模型身份，参与缓存键（见 model_cache_key）
+        roi: 只对钢筋捆区域推理："mask"、"ratio" 或 (x0, y0, x1, y1)，None 表示整图（见 roi.py）
+        predict_kwargs: 传给 model.predict 的参数（如 imgsz、conf）
+
+    Yields:
+        每帧的结果字典：name、path、total、points、seconds（本帧推理+后处理耗时）；
+        视频等来源的 name 带帧号（见 count_result）
+    """
+    if draw:
+        os.makedirs(output_dir, exist_ok=True)
+    predict_kwargs.setdefault("imgsz", imgsz)
+    predict_kwargs.setdefault("conf", conf)
+    predict_kwargs.update(save=False, save_txt=False, verbose=False)
+    if cache is not None or roi is not None:
+        results = predict_images(model, source, cache, model_key, roi, **predict_kwargs)
+    else:
+        results = model.predict(source=source, stream=True, **predict_kwargs)
+    # 标记图片由后台线程编码写出，不占用推理与后处理的时间
+    writer = AsyncImageWriter() if draw else None
+    frames = is_frame_source(source)
+    try:
+        start = time.perf_counter()
+        for index, result in enumerate(results):
+            counted = count_result(result, draw, output_dir, writer, index if frames else None)
+            now = time.perf_counter()
+            counted["seconds"] = now - start
+            start = now
+            yield counted
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO推理与后处理流水线（不经过预测标签文件）")
+    parser.add_argument("--source", default=source_dir, help="图片文件夹或视频路径")
+    parser.add_argument("--weights", default=weights_path, help="模型权重路径")
+    parser.add_argument("--backend", default=backend, choices=list(BACKENDS), help="推理后端")
+    parser.add_argument("--int8", action="store_true", default=int8, help="使用 int8 量化模型（仅 openvino）")
+    parser.add_argument("--replay-labels", default=None, help="用已有的预测标签（文件夹或标签库）代替模型推理")
+    parser.add_argument("--draw", action="store_true", help="保存标记图片")
+    parser.add_argument("--output", default=output_dir, help="标记图片输出文件夹")
+    parser.add_argument("--cache", default=None, help="预测结果缓存数据库路径（如 cache/results.sqlite），不指定则不缓存")
+    parser.add_argument("--roi", default=None, choices=ROI_MODES, help="只对钢筋捆区域推理（mask：亮区范围，ratio：图像下部）")
+    args = parser.parse_args()
+
+    if args.replay_labels:
+        model = ReplayModel(args.replay_labels)
+        model_key = replay_cache_key(args.replay_labels)
+    else:
+        model = load_model(args.weights, args.backend, args.int8)
+        model_key = model_cache_key(args.weights, args.backend, args.int8)
+    cache = ResultCache(args.cache) if args.cache else None
+    total_start = time.perf_counter()
+    frames = 0
+    for counted in run_pipeline(model, args.source, args.draw, args.output, cache, model_key, args.roi):
+        frames += 1
+        print(f"{counted['name']}: 计数 {counted['total']}，耗时 {counted['seconds'] * 1000:.1f}ms")
+    elapsed = time.perf_counter() - total_start
+    if frames:
+        print(f"共处理 {frames} 帧，总耗时 {elapsed:.2f}s，{frames / elapsed:.1f} 帧/秒")
@@ -0,0 +1,133 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageProfiler:
+    """
+    分阶段性能记录：耗时、特征点数量及数组内存峰值
+
+    用法:
+        profiler = StageProfiler()
+        with profiler.stage("second_detection", image="1.bmp") as record:
+            ...
+            record["kp_raw"] = len(keypoints)
+        profiler.to_jsonl("profile.jsonl")
+        profiler.close()
+
+    也可用 with StageProfiler() as profiler: ...，退出时自动 close()。
+
+    内存峰值基于 tracemalloc，统计的是 Python/NumPy 分配（含 OpenCV 返回的数组），
+    不包含 OpenCV 内部的临时缓冲区。
+    """
+
+    def __init__(self, trace_memory=True):
+        self.records = []
+        # reset_peak 需要 Python 3.9+
+        self.trace_memory = trace_memory and hasattr(tracemalloc, "reset_peak")
+        self._stack = []  # 嵌套阶段的内存峰值记录
+        self._started_tracing = False  # 是否由本对象开启了 tracemalloc（只停止自己开启的）
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """记录一个阶段；返回的字典可写入该阶段的计数等附加字段"""
+        record = {"stage": name, **labels}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # 先把父阶段到目前为止的峰值记下，再为子阶段重置
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame = {"base": current, "peak": current}
+            self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            if self.trace_memory:
+                self._stack.pop()
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak - frame["base"]
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            self.records.append(record)
+
+    def close(self):
+        """停止由本对象开启的 tracemalloc，之后的内存分配不再有跟踪开销（已有记录仍可导出）"""
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def to_jsonl(self, path, mode="a"):
+        """以 JSON Lines 格式写出（默认追加，便于跨运行累积）"""
+        with open(path, mode, encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def to_prometheus(self, prefix="steel"):
+        """按阶段汇总为 Prometheus 文本格式"""
+        stats = {}
+        for record in self.records:
+            s = stats.setdefault(record["stage"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                   "peak_bytes": 0, "keypoints": {}})
+            s["count"] += 1
+            s["seconds"] += record["seconds"]
+            s["max_seconds"] = max(s["max_seconds"], record["seconds"])
+            s["peak_bytes"] = max(s["peak_bytes"], record.get("peak_bytes", 0))
+            for key, value in record.items():
+                if key.startswith("kp_"):
+                    s["keypoints"][key[3:]] = s["keypoints"].get(key[3:], 0) + value
+
+        # 同一指标的所有样本需连续输出
+        seconds = [f"# TYPE {prefix}_stage_seconds summary"]
+        max_seconds = [f"# TYPE {prefix}_stage_seconds_max gauge"]
+        peak_bytes = [f"# TYPE {prefix}_stage_peak_bytes gauge"]
+        keypoints = [f"# TYPE {prefix}_stage_keypoints_total counter"]
+        for stage, s in stats.items():
+            label = f'stage="{stage}"'
+            seconds.append(f"{prefix}_stage_seconds_sum{{{label}}} {s['seconds']:.6f}")
+            seconds.append(f"{prefix}_stage_seconds_count{{{label}}} {s['count']}")
+            max_seconds.append(f"{prefix}_stage_seconds_max{{{label}}} {s['max_seconds']:.6f}")
+            peak_bytes.append(f"{prefix}_stage_peak_bytes{{{label}}} {s['peak_bytes']}")
+            for kind, total in s["keypoints"].items():
+                keypoints.append(f'{prefix}_stage_keypoints_total{{{label},kind="{kind}"}} {total}')
+        families = [seconds, max_seconds, keypoints]
+        if self.trace_memory:
+            families.append(peak_bytes)
+        return "\n".join(line for family in families for line in family) + "\n"
+
+    def summary(self):
+        """打印各阶段耗时汇总"""
+        totals = {}
+        for record in self.records:
+            count, seconds = totals.get(record["stage"], (0, 0.0))
+            totals[record["stage"]] = (count + 1, seconds + record["seconds"])
+        for stage, (count, seconds) in totals.items():
+            print(f"{stage:<28} 次数 {count:>5}  总耗时 {seconds:>8.3f}s  平均 {seconds / count * 1000:>8.1f}ms")
+
+
+class NullProfiler:
+    """未开启性能记录时使用的空实现"""
+
+    records = ()
+
+    @contextmanager
+    def stage(self, name, **labels):
+        yield {}
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
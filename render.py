@@ -0,0 +1,184 @@
+import os
+import queue
+import threading
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_output_dir = "results"  # 结果图默认输出文件夹
+default_format = "jpg"          # 结果图默认格式：jpg / png / bmp
+jpeg_quality = 95          # jpg 质量
+png_compress_level = 1     # png 压缩级别（0-9），越小编码越快
+writer_queue_size = 8      # 后台写出队列长度，队列满时提交方等待（限制待写图片占用的内存）
+# --------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=64)
+def disk_offsets(radius, thickness=-1):
+    """
+    cv2.circle 圆形标记的像素偏移（相对圆心），在小画布上画一次得到，与逐点绘制的像素完全一致
+
+    Args:
+        radius (int): 半径
+        thickness (int): -1 为实心圆，正数为圆环线宽
+
+    Returns:
+        (dy, dx) 两个 int 数组
+    """
+    side = 2 * radius + 1
+    canvas = np.zeros((side, side), np.uint8)
+    cv2.circle(canvas, (radius, radius), radius, 1, thickness)
+    dy, dx = np.nonzero(canvas)
+    return dy - radius, dx - radius
+
+
+@lru_cache(maxsize=64)
+def ellipse_offsets(width, height):
+    """ImageDraw.ellipse 实心椭圆（外接框 [0, 0, width, height]）的像素偏移（相对外接框左上角）"""
+    canvas = Image.new("L", (width + 1, height + 1), 0)
+    ImageDraw.Draw(canvas).ellipse([0, 0, width, height], fill=1)
+    return np.nonzero(np.asarray(canvas))
+
+
+def _fill(image, ys, xs, color):
+    """给图像范围内的像素 (ys, xs) 赋颜色"""
+    height, width = image.shape[:2]
+    inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+    ys, xs = ys[inside], xs[inside]
+    if image.flags.c_contiguous:
+        # 按通道对展平后的像素下标赋值，比二维花式索引整体赋值快
+        flat = image.reshape(height * width, -1)
+        index = ys * width + xs
+        for channel, value in enumerate(np.broadcast_to(color, flat.shape[1])):
+            flat[index, channel] = value
+    else:
+        image[ys, xs] = color
+
+
+def stamp(image, centers, radius, color, thickness=-1, style="cv2"):
+    """
+    在图像上一次性画出所有圆形标记（原地修改并返回 image），与逐点绘制的像素完全一致
+
+    Args:
+        image: (H, W) 或 (H, W, C) 数组
+        centers: (N, 2) 圆心坐标 (x, y)
+        radius: 半径，整数或每个点一个半径的数组
+        color: 颜色（与 image 的通道数一致）
+        thickness (int): -1 为实心圆，正数为圆环线宽（仅 cv2 样式）
+        style (str): "cv2"（cv2.circle(image, (int(x), int(y)), radius, ...)）
+            或 "pil"（ImageDraw.ellipse([x - r, y - r, x + r, y + r])，实心）
+    """
+    centers = np.asarray(centers, np.float64).reshape(-1, 2)
+    if not len(centers):
+        return image
+    radii = np.broadcast_to(np.asarray(radius, np.int64), len(centers))
+    if style == "pil":
+        # ImageDraw 对外接框的每个坐标分别向零取整，越过图像左/上边缘的圆因此会小一个像素，按取整后的框大小分组
+        top_left = np.trunc(centers - radii[:, None]).astype(np.int64)
+        sizes = np.trunc(centers + radii[:, None]).astype(np.int64) - top_left
+        for w, h in np.unique(sizes, axis=0):
+            dy, dx = ellipse_offsets(int(w), int(h))
+            group = top_left[(sizes[:, 0] == w) & (sizes[:, 1] == h)]
+            _fill(image, (group[:, 1:2] + dy).ravel(), (group[:, 0:1] + dx).ravel(), color)
+    else:
+        centers = np.trunc(centers).astype(np.int64)
+        for r in np.unique(radii):
+            dy, dx = disk_offsets(int(r), thickness)
+            group = centers[radii == r]
+            _fill(image, (group[:, 1:2] + dy).ravel(), (group[:, 0:1] + dx).ravel(), color)
+    return image
+
+
+def blend_mask(image, mask, color, alpha=0.5):
+    """将蒙版区域与指定颜色按 alpha 混合（原地修改并返回 image）"""
+    selected = mask == 255
+    image[selected] = image[selected] * (1 - alpha) + np.array(color) * alpha
+    return image
+
+
+def encode_params(path):
+    """按扩展名返回 cv2 编码参数"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compress_level]
+    return []
+
+
+def read_image(path):
+    """读取彩色图片（BGR）；先读字节再解码，路径含中文时在 Windows 上也能正常读取"""
+    image = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"无法读取图片 '{path}'")
+    return image
+
+
+def write_image(path, image):
+    """编码并写出图片（BGR）；先编码再写文件，路径含中文时在 Windows 上也能正常保存"""
+    ok, buffer = cv2.imencode(os.path.splitext(path)[1], image, encode_params(path))
+    if not ok:
+        raise ValueError(f"无法编码图片 '{path}'")
+    buffer.tofile(path)
+
+
+def result_path(name, suffix, output_dir=None, fmt=None):
+    """结果图路径：<output_dir>/<name>_<suffix>.<fmt>，并确保文件夹存在"""
+    output_dir = output_dir or default_output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{name}_{suffix}.{fmt or default_format}")
+
+
+class AsyncImageWriter:
+    """
+    后台线程编码并写出图片，计数循环只负责提交
+
+    队列有界，写出跟不上时 submit 会等待，避免待写图片无限占用内存。编码与写文件时
+    OpenCV 会释放 GIL，因此与计数并行进行。
+
+    示例:
+        with AsyncImageWriter() as writer:
+            writer.submit("results/a_result.jpg", image)
+    """
+
+    def __init__(self, queue_size=writer_queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, name="AsyncImageWriter", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, image = item
+            try:
+                write_image(path, image)
+                self.written += 1
+            except Exception as e:
+                self.errors.append((path, str(e)))
+
+    def submit(self, path, image):
+        """提交一张待写出的图片（BGR 数组，提交后不要再修改）"""
+        if not self.thread.is_alive():
+            raise RuntimeError("写出线程已关闭")
+        self.queue.put((path, image))
+
+    def close(self):
+        """等待队列中的图片全部写完"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        for path, error in self.errors:
+            print(f"写出图片 '{path}' 出错：{error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
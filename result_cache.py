@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import argparse
+
+import cv2
+import numpy as np
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_cache_path = "cache/results.sqlite"  # 缓存数据库路径
+default_max_bytes = 512 * 1024 * 1024       # 缓存容量上限（字节），超出时淘汰最久未使用的条目
+# --------------------------------------------------------------------------
+
+
+def image_digest(image):
+    """图像内容哈希：ndarray 按像素与形状计算，字节串（编码后的文件内容）直接计算"""
+    h = hashlib.sha1()
+    if isinstance(image, np.ndarray):
+        h.update(str((image.shape, image.dtype.str)).encode())
+        h.update(np.ascontiguousarray(image).data)
+    else:
+        h.update(image)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """图像文件内容哈希"""
+    with open(path, "rb") as f:
+        return image_digest(f.read())
+
+
+def stage_key(digest, stage, params, parent=None):
+    """阶段缓存键：图像哈希 + 阶段名 + 阶段参数 + 上游阶段的键（上游变化时下游随之失效）"""
+    payload = json.dumps({"image": digest, "stage": stage, "params": params, "parent": parent},
+                         sort_keys=True, default=repr)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def keypoints_to_array(keypoints):
+    """cv2.KeyPoint 列表 -> (N, 7) 数组：x, y, size, angle, response, octave, class_id"""
+    return np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+                     for kp in keypoints], np.float64).reshape(-1, 7)
+
+
+def array_to_keypoints(array):
+    """(N, 7) 数组 -> cv2.KeyPoint 列表"""
+    return [cv2.KeyPoint(x, y, size, angle, response, int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in array.tolist()]
+
+
+class ResultCache:
+    """
+    持久化的中间结果缓存（SQLite），按内容哈希+参数寻址，按总大小做 LRU 淘汰
+
+    值以 pickle 保存，仅用于本机可信的缓存文件。多进程可共享同一数据库文件。
+
+    示例:
+        cache = ResultCache("cache/results.sqlite")
+        counter = SteelCounter(path, cache=cache)
+    """
+
+    def __init__(self, path=default_cache_path, max_bytes=default_max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def __getstate__(self):
+        # 传给工作进程时不携带数据库连接，在子进程中重新打开
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                               "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                               "stage TEXT, accessed REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        return self._conn
+
+    def get(self, key):
+        """读取缓存，未命中返回 None"""
+        row = self.conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.conn:
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value, stage=None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO results (key, value, size, stage, accessed) "
+                              "VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), stage, time.time()))
+        self.evict()
+
+    def evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - self.max_bytes
+        victims, freed = [], 0
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        with self.conn:
+            self.conn.executemany("DELETE FROM results WHERE key = ?", victims)
+        return len(victims)
+
+    def stats(self):
+        """各阶段的条目数与大小"""
+        rows = self.conn.execute("SELECT stage, COUNT(*), SUM(size) FROM results GROUP BY stage").fetchall()
+        return {stage: {"entries": count, "bytes": size} for stage, count, size in rows}
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM results")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看或清空计数结果缓存")
+    parser.add_argument("--path", default=default_cache_path, help="缓存数据库路径")
+    parser.add_argument("--clear", action="store_true", help="清空缓存")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path)
+    if args.clear:
+        cache.clear()
+        print(f"已清空缓存 '{args.path}'")
+    for stage, s in cache.stats().items():
+        print(f"{stage}: {s['entries']} 条，{s['bytes'] / 1024:.1f} KB")
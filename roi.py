@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+import post_progress
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+density_ratio = 0.15    # 行/列亮区像素数（平滑后）达到最大值的该比例才算钢筋捆区域，过滤上方零散的反光
+smooth_window = 31      # 行/列亮区投影的平滑窗口（像素）
+pad_ratio = 0.05        # ROI 外扩宽度（相对图像长边），保证边缘钢筋完整
+ratio_pad = 0.05        # ratio 模式在 min_y_ratio 线以上额外保留的高度（相对图像高度），避免跨线钢筋被截断后中心偏移
+bright_threshold = 114  # YOLO 路径的亮区阈值（原始灰度），对应 SteelCounter 默认的 threshold_low=80、mask_threshold=50
+align = 32              # ROI 左上角对齐到该值的整数倍，保证SIFT金字塔采样网格与整图一致
+# --------------------------------------------------------------------------
+
+ROI_MODES = ("mask", "ratio")
+
+
+def _span(profile, ratio=density_ratio, window=smooth_window):
+    """投影曲线中不低于最大值 ratio 倍的首尾位置 [start, end)"""
+    smoothed = np.convolve(profile, np.ones(window) / window, mode="same")
+    idx = np.flatnonzero(smoothed >= ratio * smoothed.max())
+    return int(idx[0]), int(idx[-1]) + 1
+
+
+def _pad_and_align(box, shape, pad):
+    """外扩、左上角向下对齐并裁剪到图像范围内"""
+    height, width = shape[:2]
+    x0, y0, x1, y1 = box
+    x0 = max(x0 - pad, 0) // align * align
+    y0 = max(y0 - pad, 0) // align * align
+    return x0, y0, min(x1 + pad, width), min(y1 + pad, height)
+
+
+def mask_roi(mask):
+    """
+    由亮区蒙版确定钢筋捆区域
+
+    按行、列统计亮区像素数，取密集部分的范围，再外扩 pad_ratio。
+    钢筋端面密集排列，而上方钢筋侧面的零散反光密度低，不会把 ROI 撑大。
+
+    Returns:
+        (x0, y0, x1, y1)；蒙版全黑时返回 None
+    """
+    if not mask.any():
+        return None
+    y0, y1 = _span(np.count_nonzero(mask, axis=1))
+    x0, x1 = _span(np.count_nonzero(mask, axis=0))
+    return _pad_and_align((x0, y0, x1, y1), mask.shape, int(pad_ratio * max(mask.shape[:2])))
+
+
+def ratio_roi(shape, min_y=post_progress.min_y_ratio):
+    """按 post_progress 的 min_y_ratio 只保留图像下部（含 ratio_pad 的余量）"""
+    height, width = shape[:2]
+    return _pad_and_align((0, int(min_y * height), width, height), shape, int(ratio_pad * height))
+
+
+def bright_mask(gray, threshold=bright_threshold):
+    """原始灰度图的亮区蒙版（与 SteelCounter 的初始蒙版相同的开闭运算）"""
+    _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+    kernel = np.ones((3, 3), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+
+def find_roi(roi, gray=None, mask=None):
+    """
+    解析 ROI 设置
+
+    Args:
+        roi: "mask"（由亮区蒙版确定）、"ratio"（按 min_y_ratio）或 (x0, y0, x1, y1)
+        gray: 灰度图（mask 为 None 时用于计算亮区蒙版）
+        mask: 已有的亮区蒙版
+
+    Returns:
+        (x0, y0, x1, y1)；无法确定时返回整图
+    """
+    shape = (mask if mask is not None else gray).shape
+    height, width = shape[:2]
+    if roi == "mask":
+        box = mask_roi(bright_mask(gray) if mask is None else mask)
+    elif roi == "ratio":
+        box = ratio_roi(shape)
+    elif isinstance(roi, str):
+        raise ValueError(f"未知的 ROI 模式 '{roi}'，可选: {', '.join(ROI_MODES)}")
+    else:
+        x0, y0, x1, y1 = map(int, roi)
+        box = (max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))
+    return box or (0, 0, width, height)
+
+
+def roi_to_image_xywhn(xywhn, box, shape):
+    """将 ROI 裁剪图上的归一化框 (N, 4) 映射回整图的归一化坐标"""
+    height, width = shape[:2]
+    x0, y0, x1, y1 = box
+    xywhn = np.asarray(xywhn, np.float64).reshape(-1, 4)
+    scale = np.array([(x1 - x0) / width, (y1 - y0) / height] * 2)
+    return xywhn * scale + [x0 / width, y0 / height, 0, 0]
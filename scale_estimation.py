@@ -0,0 +1,105 @@
+import os
+import glob
+import time
+import cv2
+import numpy as np
+
+# 各快速估计方法换算到SIFT尺度（SteelCounter.most_common_scale）的标定系数，由 task/ 样例图标定
+DISTANCE_CALIBRATION = 1.15   # 距离变换峰值（亮斑半径）-> SIFT尺度
+AUTOCORR_CALIBRATION = 0.40   # 自相关首峰位置（钢筋中心间距）-> SIFT尺度
+
+
+def _downsample_mask(mask, factor):
+    """降采样蒙版并重新二值化"""
+    if factor == 1:
+        return mask
+    small = cv2.resize(mask, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    _, small = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)
+    return small
+
+
+def estimate_scale_distance(stretched_image, mask, factor=0.25):
+    """距离变换峰值直方图：亮斑中心到边缘的距离近似为钢筋半径"""
+    small = _downsample_mask(mask, factor)
+    dist = cv2.distanceTransform(small, cv2.DIST_L2, 5)
+    # 局部极大值即各亮斑的"中心"
+    peaks = (dist == cv2.dilate(dist, np.ones((3, 3), np.uint8))) & (dist >= 1.5)
+    radii = dist[peaks] / factor
+    if len(radii) == 0:
+        raise ValueError("距离变换未找到亮斑，请调整图像或参数")
+    # 去掉边缘毛刺、细长连接处等产生的小峰值
+    radii = radii[radii >= 0.5 * np.percentile(radii, 90)]
+    return float(np.median(radii)) * DISTANCE_CALIBRATION
+
+
+def estimate_scale_autocorr(stretched_image, mask, factor=0.25):
+    """径向自相关（FFT）：紧密排列的钢筋端面在自相关上的首个峰即为中心间距"""
+    small = _downsample_mask(mask, factor).astype(np.float32)
+    small -= small.mean()
+    h, w = small.shape
+    spectrum = np.fft.rfft2(small, s=(2 * h, 2 * w))
+    autocorr = np.fft.fftshift(np.fft.irfft2(np.abs(spectrum) ** 2, s=(2 * h, 2 * w)))
+
+    # 按半径取平均得到径向剖面
+    yy, xx = np.indices(autocorr.shape)
+    radius = np.hypot(yy - h, xx - w).astype(np.int32)
+    valid = radius < min(h, w) // 2
+    profile = np.bincount(radius[valid], autocorr[valid]) / np.bincount(radius[valid])
+    if profile[0] <= 0:
+        raise ValueError("蒙版为空，无法估计尺度")
+
+    # 跳过零点附近的下降段，取第一个局部极大值
+    diff = np.diff(profile)
+    rising = np.argmax(diff > 0)
+    peak = rising + np.argmax(diff[rising:] < 0)
+    if peak == 0 or peak >= len(profile) - 1:
+        raise ValueError("自相关未找到周期峰，请调整图像或参数")
+
+    # 抛物线插值得到亚像素峰位
+    left, mid, right = profile[peak - 1], profile[peak], profile[peak + 1]
+    denom = left - 2 * mid + right
+    offset = 0.5 * (left - right) / denom if denom != 0 else 0.0
+    return float(peak + offset) / factor * AUTOCORR_CALIBRATION
+
+
+# 可选的快速尺度估计方法（"sift" 为 SteelCounter 内置的原始方法）
+SCALE_ESTIMATORS = {
+    "distance": estimate_scale_distance,
+    "autocorr": estimate_scale_autocorr,
+}
+
+
+# 在 task/ 样例图上对比各方法与原始SIFT方法的尺度误差、耗时与最终计数
+if __name__ == "__main__":
+    from task import SteelCounter
+
+    image_files = sorted(glob.glob(os.path.join(os.getcwd(), "task", "*.bmp")))
+    methods = ["sift"] + list(SCALE_ESTIMATORS)
+    errors = {m: [] for m in methods}
+    latency = {m: [] for m in methods}
+    count_diff = {m: [] for m in methods}
+
+    for image_path in image_files:
+        row = []
+        reference = None
+        reference_total = None
+        for method in methods:
+            counter = SteelCounter(image_path, scale_method=method)
+            start = time.perf_counter()
+            counter.first_detection()
+            latency[method].append((time.perf_counter() - start) * 1000)
+            counter.second_detection()
+            counter.third_detection()
+            counter.fourth_detection()
+            total = sum(counter.counts)
+            if reference is None:
+                reference, reference_total = counter.most_common_scale, total
+            errors[method].append(abs(counter.most_common_scale / reference - 1))
+            count_diff[method].append(abs(total - reference_total))
+            row.append(f"{method}: {counter.most_common_scale:.2f}/{total}")
+        print(os.path.basename(image_path), "  ".join(row))
+
+    print(f"{'方法':<10} {'平均耗时(ms)':>12} {'平均尺度误差':>12} {'平均计数差':>10}")
+    for method in methods:
+        print(f"{method:<10} {np.mean(latency[method]):>12.1f} "
+              f"{np.mean(errors[method]) * 100:>11.1f}% {np.mean(count_diff[method]):>10.2f}")
@@ -0,0 +1,244 @@
+import os
+import glob
+import time
+import queue
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+from batch_post import postprocess_centers
+from backends import BACKENDS
+from predict_pipeline import to_numpy, load_model, weights_path, source_dir, imgsz, conf, image_exts
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_max_batch = 8       # 每个微批次的最大帧数
+default_max_wait = 0.05     # 凑批等待上限（秒）：从批次第一帧就绪起，超时即使未满也立即推理
+default_loader_threads = 2  # 预读取+letterbox 的后台线程数
+default_prefetch = 2        # 就绪队列最多缓存几个批次的帧
+default_p95_bound = None    # 从拿到照片到输出计数的 p95 上限（秒），超出时自动调节批次；None 表示不限制
+letterbox_color = (114, 114, 114)  # 填充颜色，与 ultralytics 一致
+# --------------------------------------------------------------------------
+
+_DONE = object()  # 读取线程结束标记
+
+
+def letterbox(image, size=imgsz, color=letterbox_color):
+    """
+    等比例缩放并居中填充为 size x size（与 ultralytics LetterBox 相同的取整方式）
+
+    Returns:
+        (padded, ratio, (pad_x, pad_y))
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (left, top)
+
+
+def unletterbox_centers(xywhn, ratio, pad, orig_shape, size=imgsz):
+    """把 letterbox 图上的归一化中心点映射回原图的相对坐标"""
+    height, width = orig_shape[:2]
+    centers = to_numpy(xywhn).reshape(-1, 4)[:, :2] * size
+    centers = (centers - pad) / ratio
+    return centers / [width, height]
+
+
+class MicroBatchScheduler:
+    """
+    YOLO 推理的微批次调度器
+
+    后台线程预先读取并 letterbox 图片放入就绪队列；调度循环按“凑满 max_batch 或等待超过 max_wait”
+    组成微批次交给模型推理，推理当前批次时后台线程已在准备下一批。
+    设置 p95_bound 后，按最近帧的照片到计数 p95 自动调节批次上限（见 _adapt）。
+
+    示例:
+        scheduler = MicroBatchScheduler(model, max_batch=8, p95_bound=1.0)
+        for counted in scheduler.run(image_paths):
+            print(counted["name"], counted["total"])
+        scheduler.report()
+    """
+
+    def __init__(self, model, max_batch=default_max_batch, max_wait=default_max_wait,
+                 loader_threads=default_loader_threads, prefetch=default_prefetch, p95_bound=default_p95_bound,
+                 size=imgsz, **predict_kwargs):
+        """
+        Args:
+            model: ultralytics.YOLO 或同接口对象（predict(source=图片数组列表) 返回 Results 列表）
+            max_batch (int): 最大批次
+            max_wait (float): 凑批等待上限（秒）
+            loader_threads (int): 预读取线程数
+            prefetch (int): 就绪队列容量（以批次计）
+            p95_bound (float): 照片到计数 p95 上限（秒），None 表示不限制
+            size (int): 推理尺寸
+            predict_kwargs: 传给 model.predict 的其他参数（如 conf）
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.loader_threads = loader_threads
+        self.prefetch = prefetch
+        self.p95_bound = p95_bound
+        self.size = size
+        predict_kwargs.setdefault("conf", conf)
+        self.predict_kwargs = predict_kwargs
+        self.batch_size = max_batch  # 当前批次上限（受 p95_bound 调节）
+        self.stats = {"batches": 0, "frames": 0, "fill": [], "queue_depth": [], "latency": [],
+                      "infer_seconds": 0.0, "elapsed": 0.0}
+
+    def _load(self, tasks, ready):
+        """后台线程：读取并 letterbox 图片"""
+        while True:
+            task = tasks.get()
+            if task is _DONE:
+                ready.put(_DONE)
+                return
+            name, path, arrived = task
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                ready.put((name, path, arrived, None, None, None, None))
+                continue
+            padded, ratio, pad = letterbox(image, self.size)
+            ready.put((name, path, arrived, padded, ratio, pad, image.shape))
+
+    def _feed(self, image_paths, tasks):
+        """后台线程：按顺序把图片交给读取线程，并记录拿到照片的时间"""
+        for path in image_paths:
+            tasks.put((os.path.basename(path), path, time.perf_counter()))
+        for _ in range(self.loader_threads):
+            tasks.put(_DONE)
+
+    def _next_batch(self, ready, finished):
+        """凑一个微批次：阻塞等待第一帧，此后最多等待 max_wait 或凑满当前批次上限"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size and finished[0] < self.loader_threads:
+            timeout = None if deadline is None else deadline - time.perf_counter()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = ready.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished[0] += 1
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.perf_counter() + self.max_wait
+        return batch
+
+    def _adapt(self):
+        """
+        根据最近帧的 p95 延迟调节批次上限
+
+        超出上限时：若就绪队列积压（吞吐不足），增大批次以更快消化积压；
+        否则延迟来自凑批与大批次推理本身，减小批次。远低于上限时逐步恢复批次。
+        """
+        if self.p95_bound is None:
+            return
+        recent = self.stats["latency"][-4 * self.max_batch:]
+        p95 = float(np.percentile(recent, 95))
+        if p95 > self.p95_bound:
+            if self.stats["queue_depth"][-1] >= self.batch_size:
+                self.batch_size = min(self.max_batch, self.batch_size * 2)
+            else:
+                self.batch_size = max(1, self.batch_size // 2)
+        elif p95 < 0.8 * self.p95_bound and self.batch_size < self.max_batch:
+            self.batch_size += 1
+
+    def run(self, image_paths):
+        """
+        调度推理并逐帧输出计数（按完成顺序，读取线程并行时可能与输入顺序不同）
+
+        image_paths 可以是列表，也可以是随拍随出的生成器（如相机触发），每帧的延迟从取到路径时算起。
+
+        Yields:
+            dict: name、path、total、points（原图绝对像素坐标）、latency（照片到计数，秒）、error
+        """
+        capacity = max(1, self.prefetch * self.max_batch)
+        tasks = queue.Queue(maxsize=capacity)
+        ready = queue.Queue(maxsize=capacity)
+        threads = [threading.Thread(target=self._feed, args=(image_paths, tasks), daemon=True)]
+        threads += [threading.Thread(target=self._load, args=(tasks, ready), daemon=True)
+                    for _ in range(self.loader_threads)]
+        for thread in threads:
+            thread.start()
+
+        start = time.perf_counter()
+        finished = [0]
+        while True:
+            batch = self._next_batch(ready, finished)
+            if not batch:
+                if finished[0] >= self.loader_threads:
+                    break
+                continue
+            self.stats["queue_depth"].append(ready.qsize())
+            self.stats["fill"].append(len(batch) / self.max_batch)
+            self.stats["batches"] += 1
+
+            valid = [item for item in batch if item[3] is not None]
+            infer_start = time.perf_counter()
+            results = self.model.predict(source=[item[3] for item in valid], imgsz=self.size, verbose=False,
+                                         **self.predict_kwargs) if valid else []
+            self.stats["infer_seconds"] += time.perf_counter() - infer_start
+            results = iter(results)
+
+            for name, path, arrived, padded, ratio, pad, shape in batch:
+                counted = {"name": name, "path": path, "total": None, "points": None, "error": None}
+                if padded is None:
+                    counted["error"] = "无法读取图片"
+                else:
+                    centers_rel = unletterbox_centers(next(results).boxes.xywhn, ratio, pad, shape, self.size)
+                    points = postprocess_centers(centers_rel, shape[1], shape[0])
+                    counted["total"] = len(points)
+                    counted["points"] = points
+                counted["latency"] = time.perf_counter() - arrived
+                self.stats["latency"].append(counted["latency"])
+                self.stats["frames"] += 1
+                yield counted
+            self._adapt()
+        self.stats["elapsed"] = time.perf_counter() - start
+
+    def report(self):
+        """打印批次填充率、队列深度、延迟分位数与吞吐量"""
+        s = self.stats
+        if not s["frames"]:
+            print("没有处理任何图片")
+            return
+        latency = np.array(s["latency"]) * 1000
+        print(f"共 {s['frames']} 帧、{s['batches']} 个批次，平均批次填充率 {np.mean(s['fill']):.0%}，"
+              f"就绪队列深度 平均 {np.mean(s['queue_depth']):.1f} / 最大 {max(s['queue_depth'])}")
+        print(f"照片到计数延迟 p50 {np.percentile(latency, 50):.1f}ms  p95 {np.percentile(latency, 95):.1f}ms，"
+              f"推理耗时占比 {s['infer_seconds'] / s['elapsed']:.0%}，吞吐量 {s['frames'] / s['elapsed']:.2f} 帧/秒，"
+              f"最终批次上限 {self.batch_size}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLO微批次推理调度")
+    parser.add_argument("--source", default=source_dir, help="图片文件夹")
+    parser.add_argument("--weights", default=weights_path, help="模型权重路径")
+    parser.add_argument("--backend", default="pt", choices=list(BACKENDS), help="推理后端")
+    parser.add_argument("--int8", action="store_true", help="使用 int8 量化模型（仅 openvino）")
+    parser.add_argument("--max-batch", type=int, default=default_max_batch, help="最大批次")
+    parser.add_argument("--max-wait", type=float, default=default_max_wait, help="凑批等待上限（秒）")
+    parser.add_argument("--loader-threads", type=int, default=default_loader_threads, help="预读取线程数")
+    parser.add_argument("--p95-bound", type=float, default=default_p95_bound, help="照片到计数 p95 上限（秒）")
+    args = parser.parse_args()
+
+    image_paths = sorted(f for ext in image_exts for f in glob.glob(os.path.join(args.source, f"*{ext}")))
+    scheduler = MicroBatchScheduler(load_model(args.weights, args.backend, args.int8), args.max_batch, args.max_wait,
+                                    args.loader_threads, p95_bound=args.p95_bound)
+    for counted in scheduler.run(image_paths):
+        if counted["error"]:
+            print(f"{counted['name']}: 出错（{counted['error']}）")
+        else:
+            print(f"{counted['name']}: 计数 {counted['total']}，延迟 {counted['latency'] * 1000:.1f}ms")
+    scheduler.report()
@@ -0,0 +1,148 @@
+import os
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+import post_progress
+from backends import BACKENDS
+from batch_post import postprocess_centers
+from predict_pipeline import to_numpy, load_model, weights_path, source_dir, imgsz, conf, image_exts
+from scale_estimation import SCALE_ESTIMATORS
+from tiling import _tile_starts, overview_counter
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+target_bar_px = 16          # 希望钢筋端面在模型输入中达到的直径（像素），分块大小据此自适应
+overlap_factor = 2.5        # 分块重叠宽度（相对钢筋尺度），保证跨缝的钢筋在某一块中完整出现
+nms_threshold = 0.5         # 跨分块合并阈值：两个框的交集占较小框面积的比例超过该值视为同一根钢筋
+overview_side = 1024        # 尺度估计与亮区判断所用概览图的最长边
+min_bright_pixels = 1       # 分块（在概览图上）至少包含多少亮区像素才需要推理
+# 筛选、去重参数（min_y_ratio、distance_threshold）与 post_progress.py 相同
+# --------------------------------------------------------------------------
+
+
+def plan_tiles(gray, size=imgsz, min_y=post_progress.min_y_ratio):
+    """
+    根据估计的钢筋尺度规划分块
+
+    分块边长 = size * 钢筋直径（2 * 尺度半径）/ target_bar_px（不小于 size，不大于整图），
+    钢筋越小分块越多；整块位于 min_y 以上或不含亮区的分块直接跳过。
+
+    Returns:
+        (tiles, info)：tiles 为 [(x0, y0, x1, y1)]，info 含 scale、tile_side、skipped
+    """
+    height, width = gray.shape[:2]
+    counter, factor = overview_counter(gray, overview_side)
+    mask = counter.process_mask
+    try:
+        scale = SCALE_ESTIMATORS["distance"](counter.stretched_image, mask, min(1.0, 0.25 / factor)) / factor
+    except ValueError:
+        # 画面中没有亮斑，无法估计尺度：按整图推理一次
+        return [(0, 0, width, height)], {"scale": None, "tile_side": max(height, width), "skipped": 0}
+
+    # scale 为半径，target_bar_px 为直径
+    tile_side = int(np.clip(size * 2 * scale / target_bar_px, size, max(height, width)))
+    overlap = min(int(overlap_factor * scale), tile_side // 2)
+    tiles = []
+    skipped = 0
+    for y0 in _tile_starts(height, tile_side, overlap):
+        for x0 in _tile_starts(width, tile_side, overlap):
+            x1, y1 = min(x0 + tile_side, width), min(y0 + tile_side, height)
+            # 分块内所有检测中心都在 min_y 以上时会被后处理全部筛掉
+            above = y1 <= min_y * height
+            bright = np.count_nonzero(mask[int(y0 * factor):int(np.ceil(y1 * factor)),
+                                           int(x0 * factor):int(np.ceil(x1 * factor))])
+            if above or bright < min_bright_pixels:
+                skipped += 1
+                continue
+            tiles.append((x0, y0, x1, y1))
+    return tiles, {"scale": scale, "tile_side": tile_side, "skipped": skipped}
+
+
+def merge_boxes(boxes, scores, threshold=nms_threshold):
+    """
+    跨分块 NMS：按置信度从高到低保留，与已保留框的交集/较小框面积超过阈值的框被抑制
+
+    使用“交集占较小框”而不是 IoU，使分块边缘被截断的半个框也能与完整框合并。
+
+    Returns:
+        保留框的下标（按置信度降序）
+    """
+    if len(boxes) == 0:
+        return np.empty(0, np.int64)
+    x0, y0, x1, y1 = boxes.T
+    areas = np.maximum(x1 - x0, 0) * np.maximum(y1 - y0, 0)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.maximum(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0)
+        inter_h = np.maximum(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0)
+        smaller = np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        order = rest[inter_w * inter_h / smaller <= threshold]
+    return np.array(keep, np.int64)
+
+
+def predict_sliced(model, image, size=imgsz, **predict_kwargs):
+    """
+    分块推理一张图片：所有分块作为一个批次送入模型，合并后返回原图坐标下的检测框
+
+    Args:
+        model: ultralytics.YOLO 或同接口对象（predict(source=图片数组列表) 返回带 boxes.xyxy/conf 的结果）
+        image: BGR 图像
+
+    Returns:
+        (boxes (N, 4) xyxy, scores (N,), info)
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    tiles, info = plan_tiles(gray, size)
+    info["tiles"] = len(tiles)
+    if not tiles:
+        return np.zeros((0, 4)), np.zeros(0), info
+    predict_kwargs.setdefault("conf", conf)
+    crops = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in tiles]
+    results = model.predict(source=crops, imgsz=size, verbose=False, **predict_kwargs)
+
+    boxes, scores = [], []
+    for (x0, y0, _, _), result in zip(tiles, results):
+        boxes.append(to_numpy(result.boxes.xyxy).reshape(-1, 4) + [x0, y0, x0, y0])
+        scores.append(to_numpy(result.boxes.conf).reshape(-1))
+    boxes, scores = np.concatenate(boxes), np.concatenate(scores)
+    keep = merge_boxes(boxes, scores)
+    return boxes[keep], scores[keep], info
+
+
+def count_sliced(model, image_path, **predict_kwargs):
+    """分块推理并按 post_progress 的规则筛选、去重，返回与 predict_pipeline.count_result 相同的结果字典"""
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"无法读取图片 '{image_path}'")
+    height, width = image.shape[:2]
+    boxes, scores, info = predict_sliced(model, image, **predict_kwargs)
+    # 保持置信度从高到低的顺序，去重时优先保留高置信度的点
+    centers_rel = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2 / width, (boxes[:, 1] + boxes[:, 3]) / 2 / height], axis=1)
+    points = postprocess_centers(centers_rel, width, height)
+    return {"name": os.path.basename(image_path), "path": image_path, "total": len(points), "points": points,
+            **info}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="高分辨率图片分块YOLO推理计数")
+    parser.add_argument("--source", default=source_dir, help="图片文件夹")
+    parser.add_argument("--weights", default=weights_path, help="模型权重路径")
+    parser.add_argument("--backend", default="pt", choices=list(BACKENDS), help="推理后端")
+    parser.add_argument("--int8", action="store_true", help="使用 int8 量化模型（仅 openvino）")
+    args = parser.parse_args()
+
+    model = load_model(args.weights, args.backend, args.int8)
+    image_paths = sorted(f for ext in image_exts for f in glob.glob(os.path.join(args.source, f"*{ext}")))
+    for image_path in image_paths:
+        start = time.perf_counter()
+        counted = count_sliced(model, image_path)
+        scale = f"{counted['scale']:.1f}" if counted["scale"] else "未知"
+        print(f"{counted['name']}: 计数 {counted['total']}，钢筋尺度 {scale}，分块边长 {counted['tile_side']}，"
+              f"推理 {counted['tiles']} 块（跳过 {counted['skipped']} 块），耗时 {time.perf_counter() - start:.2f}s")
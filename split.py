@@ -2,45 +2,86 @@ import os
 import shutil
 import random
 from pathlib import Path
+from label_store import is_label_store, open_label_store, restore_precision
+from add_more_sample import write_yolo_labels
 
 
 # 设置路径
 base_dir = "base_dir"
 image_directory = os.path.join(base_dir, "steel_sample/images")  # 源图片文件夹
-label_directory = os.path.join(base_dir, "steel_sample/labels")  # 源标签文件夹
+label_directory = os.path.join(base_dir, "steel_sample/labels")  # 源标签文件夹，也可以是 label_store.py 打包的标签库文件
 output_directory = os.path.join(base_dir, "datasets/steel")  # 输出文件夹
-    
-def split_dataset(image_dir, label_dir, output_dir, train_ratio=0.7, test_ratio=0.2, val_ratio=0.1):
+
+# 划分结果的输出方式
+SPLIT_MODES = ("copy", "hardlink", "symlink", "manifest")
+
+
+def scan_stems(directory, suffix):
+    """扫描一次目录，返回指定后缀文件的文件名（不含扩展名）集合"""
+    with os.scandir(directory) as entries:
+        return {Path(e.name).stem for e in entries if e.is_file() and Path(e.name).suffix.lower() == suffix}
+
+
+def place_file(src, dest, mode):
+    """按模式把源文件放到目标位置：复制、硬链接或符号链接"""
+    if os.path.lexists(dest):
+        # 先删除旧文件或旧链接：直接复制到指向同一文件的链接上会报 SameFileError
+        os.remove(dest)
+    if mode == "copy":
+        shutil.copy2(src, dest)  # 保留文件元数据
+    elif mode == "hardlink":
+        try:
+            os.link(src, dest)
+        except OSError:
+            # 跨文件系统等无法硬链接时退回复制
+            shutil.copy2(src, dest)
+    else:
+        os.symlink(os.path.abspath(src), dest)
+
+
+def write_manifest(path, image_dir, file_list):
+    """写出文件列表清单（每行一个图片绝对路径），YOLO 会把路径中的 images 替换为 labels 查找标签"""
+    image_dir = os.path.abspath(image_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        for file_name in file_list:
+            f.write(os.path.join(image_dir, f"{file_name}.png") + "\n")
+
+
+def split_dataset(image_dir, label_dir, output_dir, train_ratio=0.7, test_ratio=0.2, val_ratio=0.1,
+                  mode="copy", seed=None):
     """
-    划分数据集并复制到指定目录
+    划分数据集并输出到指定目录
     
     Args:
         image_dir (str): 源图片文件夹路径
-        label_dir (str): 源标签文件夹路径
+        label_dir (str): 源标签文件夹路径或标签库文件（输出时还原为YOLO标签文件）
         output_dir (str): 输出文件夹路径
         train_ratio (float): 训练集比例
         test_ratio (float): 测试集比例
         val_ratio (float): 验证集比例
+        mode (str): 输出方式，copy 复制 / hardlink 硬链接 / symlink 符号链接 /
+            manifest 只写出 train.txt、test.txt、val.txt 文件列表（不占用额外磁盘）
+        seed (int): 随机种子，指定后划分结果可复现；None 表示每次随机
     """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"未知的划分方式 '{mode}'，可选: {', '.join(SPLIT_MODES)}")
     # 检查比例是否合法
     if not (abs(train_ratio + test_ratio + val_ratio - 1.0) < 1e-6):
         raise ValueError("训练集、测试集和验证集的比例之和必须为1")
     
-    # 获取所有图片文件
-    image_files = [f for f in os.listdir(image_dir) if Path(f).suffix.lower() == '.png']
+    # 每个目录只扫描一次
+    image_stems = scan_stems(image_dir, '.png')
+    store = open_label_store(label_dir) if is_label_store(label_dir) else None
+    label_stems = set(store.names) if store is not None else scan_stems(label_dir, '.txt')
     
     # 检查每个图片是否有对应的标签文件
-    valid_files = []
-    for img_file in image_files:
-        img_name = Path(img_file).stem
-        label_file = f"{img_name}.txt"
-        if label_file in os.listdir(label_dir):
-            valid_files.append(img_name)
-        else:
-            print(f"警告: 图片 {img_file} 没有对应的标签文件，已跳过")
+    for img_name in sorted(image_stems - label_stems):
+        print(f"警告: 图片 {img_name}.png 没有对应的标签文件，已跳过")
+    # 先排序再打乱，使结果只取决于随机种子而不受目录遍历顺序影响
+    valid_files = sorted(image_stems & label_stems)
     
     # 打乱文件顺序
-    random.shuffle(valid_files)
+    random.Random(seed).shuffle(valid_files)
     total = len(valid_files)
     
     if total == 0:
@@ -60,7 +101,20 @@ def split_dataset(image_dir, label_dir, output_dir, train_ratio=0.7, test_ratio=
     test_files = valid_files[train_count:train_count+test_count]
     val_files = valid_files[train_count+test_count:]
     
-    # 创建输出目录结构
+    splits = {'train': train_files, 'test': test_files, 'val': val_files}
+    if mode == "manifest":
+        os.makedirs(output_dir, exist_ok=True)
+        for split, file_list in splits.items():
+            write_manifest(os.path.join(output_dir, f"{split}.txt"), image_dir, file_list)
+        if store is not None:
+            print("警告: YOLO 训练需要与图片同级的 labels/ 文件夹，请先用 label_store.py unpack 还原标签文件")
+        elif Path(image_dir).name != 'images' or Path(label_dir).resolve() != Path(image_dir).resolve().parent / 'labels':
+            print("警告: YOLO 通过把图片路径中的 images 替换为 labels 来查找标签，"
+                  "请确保源图片与标签位于同级的 images/ 和 labels/ 文件夹中")
+        print(f"数据集划分完成! 文件列表已写入 '{output_dir}'")
+        return
+    
+    # 重建输出目录结构：清空上一次划分的结果，避免换了种子或比例后同一样本同时留在多个子集中
     dir_structure = [
         os.path.join(output_dir, 'images', 'train'),
         os.path.join(output_dir, 'images', 'test'),
@@ -70,36 +124,36 @@ def split_dataset(image_dir, label_dir, output_dir, train_ratio=0.7, test_ratio=
         os.path.join(output_dir, 'labels', 'val')
     ]
     
+    sources = [Path(image_dir).resolve(), Path(label_dir).resolve()]
+    for dir_path in dir_structure:
+        resolved = Path(dir_path).resolve()
+        if any(src == resolved or resolved in src.parents for src in sources):
+            raise ValueError(f"输出目录 '{dir_path}' 包含源数据，不能清空重建")
     for dir_path in dir_structure:
-        os.makedirs(dir_path, exist_ok=True)
+        if os.path.isdir(dir_path):
+            shutil.rmtree(dir_path)
+        os.makedirs(dir_path)
     
-    # 复制文件到相应目录
+    # 复制（或链接）文件到相应目录
     def copy_files(file_list, dest_image_dir, dest_label_dir):
         for file_name in file_list:
-            # 复制图片
+            # 图片
             src_img = os.path.join(image_dir, f"{file_name}.png")
             dest_img = os.path.join(dest_image_dir, f"{file_name}.png")
-            shutil.copy2(src_img, dest_img)  # 保留文件元数据
+            place_file(src_img, dest_img, mode)
             
-            # 复制标签
-            src_label = os.path.join(label_dir, f"{file_name}.txt")
+            # 标签（来自标签库时直接写出为YOLO标签文件）
             dest_label = os.path.join(dest_label_dir, f"{file_name}.txt")
-            shutil.copy2(src_label, dest_label)
-    
-    # 复制训练集
-    copy_files(train_files, 
-              os.path.join(output_dir, 'images', 'train'),
-              os.path.join(output_dir, 'labels', 'train'))
-    
-    # 复制测试集
-    copy_files(test_files, 
-              os.path.join(output_dir, 'images', 'test'),
-              os.path.join(output_dir, 'labels', 'test'))
+            if store is not None:
+                write_yolo_labels(dest_label, restore_precision(store[file_name]))
+            else:
+                place_file(os.path.join(label_dir, f"{file_name}.txt"), dest_label, mode)
     
-    # 复制验证集
-    copy_files(val_files, 
-              os.path.join(output_dir, 'images', 'val'),
-              os.path.join(output_dir, 'labels', 'val'))
+    # 训练集、测试集、验证集
+    for split, file_list in splits.items():
+        copy_files(file_list,
+                   os.path.join(output_dir, 'images', split),
+                   os.path.join(output_dir, 'labels', split))
     
     print("数据集划分完成!")
 
@@ -109,6 +163,9 @@ if __name__ == "__main__":
     train_ratio = 0.7   # 70% 训练集
     test_ratio = 0.2    # 20% 测试集
     val_ratio = 0.1     # 10% 验证集
+    mode = "copy"       # 输出方式：copy / hardlink / symlink / manifest（manifest 时在 steel.yaml 中指向 train.txt 等）
+    seed = 0            # 随机种子，保证划分可复现
     
     # 执行划分
-    split_dataset(image_directory, label_directory, output_directory, train_ratio, test_ratio, val_ratio)
\ No newline at end of file
+    split_dataset(image_directory, label_directory, output_directory, train_ratio, test_ratio, val_ratio,
+                  mode=mode, seed=seed)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from engine import SteelCountEngine
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_drift_tolerance = 0.15  # 检出钢筋的尺度相对估计时变化超过该比例即视为漂移，重新估计尺度
+image_exts = (".bmp", ".png", ".jpg", ".jpeg")
+# --------------------------------------------------------------------------
+
+
+def iter_frames(source):
+    """
+    逐帧读取灰度图像
+
+    Args:
+        source: 图片文件夹（按文件名顺序）、视频文件路径或摄像头编号
+
+    Yields:
+        (name, gray_image)
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        image_files = sorted(f for ext in image_exts for f in glob.glob(os.path.join(source, f"*{ext}")))
+        for image_path in image_files:
+            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                print(f"警告：无法读取 '{image_path}'，已跳过")
+                continue
+            yield os.path.basename(image_path), img
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频源 '{source}'")
+    try:
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            yield f"frame_{index:06d}", frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def _size_ratio(counter):
+    """
+    每根检出钢筋平均占用的亮区边长 sqrt(亮区面积 / 计数) 与所用尺度之比，用于判断尺度是否漂移
+
+    钢筋实际变大时每根占用的亮区变大，复用的尺度不再适用而漏检时计数减少，两者都会使比值偏离参考值。
+    不使用第二次检测特征点的尺度：这些特征点已按复用尺度的 ±40% 筛选过，比值被钳制在 1 附近，反映不出漂移。
+    """
+    total = len(counter.detections)
+    if not total or not counter.bright_area:
+        return None
+    return float(np.sqrt(counter.bright_area / total)) / counter.work_scale
+
+
+def count_stream(frames, drift_tolerance=default_drift_tolerance, engine=None, **engine_kwargs):
+    """
+    流式计数：尺度稳定时复用上一帧的钢材尺度（及对应的SIFT检测器），检测到漂移后重新估计
+
+    Args:
+        frames: (name, gray_image) 迭代器，如 iter_frames 的输出
+        drift_tolerance (float): 尺度漂移阈值（按 _size_ratio 相对估计帧的变化比例）
+        engine (SteelCountEngine): 计数引擎，为 None 时按 engine_kwargs 创建
+
+    Yields:
+        每帧的结果字典：name、total、counts、scale、reestimated、fps（本帧）、avg_fps（累计）
+
+    漂移大到复用的尺度一根钢筋也检不出时，_size_ratio 为 None，同样触发重新估计。
+    """
+    engine = engine or SteelCountEngine(**engine_kwargs)
+    scale = None
+    reference_ratio = None
+    start = time.perf_counter()
+    for index, (name, frame) in enumerate(frames):
+        frame_start = time.perf_counter()
+        reestimated = scale is None
+        try:
+            counter = engine.run(frame, name, scale)
+
+            # 尺度漂移检测：复用本帧的计数与亮区面积，不增加额外计算
+            ratio = _size_ratio(counter)
+            if not reestimated and (ratio is None or abs(ratio / reference_ratio - 1) > drift_tolerance):
+                # 本帧尺度已变化，重新估计后再计数
+                reestimated = True
+                counter = engine.run(frame, name)
+                ratio = _size_ratio(counter)
+        except ValueError as e:
+            # 画面中没有可检测的钢筋（如传送带空档），计为0并在下一帧重新估计
+            print(f"警告：{name} 检测失败（{e}）")
+            scale = None
+            now = time.perf_counter()
+            yield {"index": index, "name": name, "total": 0, "counts": (0, 0, 0), "scale": None,
+                   "reestimated": True, "fps": 1.0 / (now - frame_start), "avg_fps": (index + 1) / (now - start)}
+            continue
+        if reestimated:
+            scale = counter.most_common_scale
+            reference_ratio = ratio
+        if reference_ratio is None:
+            # 估计帧没有检出钢筋，下一帧继续重新估计
+            scale = None
+
+        counts = counter.counts
+        now = time.perf_counter()
+        yield {
+            "index": index,
+            "name": name,
+            "total": sum(counts),
+            "counts": counts,
+            "scale": counter.most_common_scale,
+            "reestimated": reestimated,
+            "fps": 1.0 / (now - frame_start),
+            "avg_fps": (index + 1) / (now - start),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="视频/图片序列流式钢筋计数")
+    parser.add_argument("source", help="图片文件夹、视频文件路径或摄像头编号")
+    parser.add_argument("--drift-tolerance", type=float, default=default_drift_tolerance, help="尺度漂移阈值")
+    parser.add_argument("--scale-method", default="sift", help="尺度估计方法：sift / distance / autocorr")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    for result in count_stream(iter_frames(source), args.drift_tolerance, scale_method=args.scale_method):
+        flag = "（重新估计尺度）" if result["reestimated"] else ""
+        print(f"{result['name']}: 计数 {result['total']}，{result['fps']:.1f} 帧/秒，"
+              f"累计 {result['avg_fps']:.1f} 帧/秒{flag}")
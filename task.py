@@ -3,27 +3,176 @@ import glob
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
-from collections import Counter
-from scipy.spatial import distance
+from collections import Counter, OrderedDict
+from dedup import dedup_mask
+from scale_estimation import SCALE_ESTIMATORS
+from profiling import NULL_PROFILER
+from result_cache import image_digest, stage_key, keypoints_to_array, array_to_keypoints
+from roi import find_roi
+from count_results import DETECTION_DTYPE, keypoints_to_detections, detections_to_array
+from render import stamp, blend_mask, result_path, write_image
+
+# 进程内复用的SIFT检测器缓存（按参数区分）
+_SIFT_CACHE = OrderedDict()
+_SIFT_CACHE_SIZE = 16
+
+
+# 各次检测结果的 cv2.KeyPoint 列表属性名
+PASS_ATTRS = {2: "filtered_kps", 3: "filtered_kps_third", 4: "filtered_kps_fourth"}
+
+# 检测参数默认值，可通过 SteelCounter(params={...}) 覆盖其中任意项
+DEFAULT_PARAMS = {
+    "mask_threshold": 50,        # 初始高亮蒙版的二值化阈值（拉伸后灰度）
+    "coarse_sift": {"nfeatures": 100, "contrastThreshold": 0.1, "edgeThreshold": 5, "sigma": 11},  # 第一次检测
+    "fine_sift": {"contrastThreshold": 0.05, "edgeThreshold": 4},  # 第二~四次检测（sigma 由尺度决定）
+    "second_tolerance": 0.40,    # 各次检测的尺度容忍度
+    "third_tolerance": 0.40,
+    "fourth_tolerance": 0.25,
+    "blackout_factor": 1.2,      # 涂黑半径（相对钢材尺度）
+    "min_dist_factor": 0.9,      # 去重距离（相对钢材尺度）
+}
+
+
+# SIFT检测器参数（嵌套项）允许的键；fine_sift 的 sigma 由钢材尺度决定，不能指定
+NESTED_PARAM_KEYS = {
+    "coarse_sift": {"nfeatures", "nOctaveLayers", "contrastThreshold", "edgeThreshold", "sigma"},
+    "fine_sift": {"nfeatures", "nOctaveLayers", "contrastThreshold", "edgeThreshold"},
+}
+
+
+def merge_params(params=None):
+    """
+    合并用户参数与默认参数，未知参数名直接报错
+
+    嵌套的SIFT参数逐项合并：params={"coarse_sift": {"nfeatures": 200}} 只覆盖 nfeatures，其余沿用默认值
+    """
+    params = params or {}
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的检测参数: {', '.join(sorted(unknown))}")
+    merged = {**DEFAULT_PARAMS, **params}
+    for name, allowed in NESTED_PARAM_KEYS.items():
+        if name in params:
+            unknown = set(params[name]) - allowed
+            if unknown:
+                raise ValueError(f"未知的 {name} 参数: {', '.join(sorted(unknown))}")
+            merged[name] = {**DEFAULT_PARAMS[name], **params[name]}
+    return merged
+
+
+def get_sift(**params):
+    """获取指定参数的SIFT检测器，相同参数的检测器在进程内只创建一次"""
+    key = tuple(sorted(params.items()))
+    sift = _SIFT_CACHE.get(key)
+    if sift is None:
+        sift = cv2.SIFT_create(**params)
+        _SIFT_CACHE[key] = sift
+        if len(_SIFT_CACHE) > _SIFT_CACHE_SIZE:
+            _SIFT_CACHE.popitem(last=False)
+    else:
+        _SIFT_CACHE.move_to_end(key)
+    return sift
 
 
 class SteelCounter:
-    def __init__(self, image_path, threshold_low=80):
-        # 初始化参数与图像读取
+    def __init__(self, image_path, threshold_low=80, restrict_to_blobs=True, scale_method="sift",
+                 target_scale=None, image=None, params=None, profiler=None, cache=None, roi=None, slim=False):
+        # 初始化参数与图像读取（传入 image 时直接使用该灰度图，image_path 仅作为名称）
         self.image_path = image_path
         self.image_name = os.path.basename(image_path)
         self.threshold_low = threshold_low
-        self.original_image = self._read_image()
-        self.process_image = self.original_image.copy()
-        self.stretched_image = self.stretch_bright_region(self.process_image)
-        self.process_mask = self._create_initial_mask()
+        self.restrict_to_blobs = restrict_to_blobs  # 第三、四次检测仅在剩余亮斑附近运行SIFT
+        self.scale_method = scale_method  # 尺度估计方法："sift" 或 scale_estimation.SCALE_ESTIMATORS 中的快速方法
+        self.target_scale = target_scale  # 归一化分辨率模式：将图像缩放到该钢材尺度后再检测（None 表示原分辨率）
+        self.params = merge_params(params)
+        self.profiler = profiler or NULL_PROFILER  # 传入 profiling.StageProfiler 以记录各阶段耗时与内存
+        self.cache = cache  # 传入 result_cache.ResultCache 以复用参数未变的阶段结果
+        self._digest = None
+        self._parent_key = None  # 上一阶段的缓存键：尺度确定后依次为各次检测的上游
+        # 精简模式：只以结构化数组保存检测结果（filtered_kps* 为 None），各阶段用完的图像立即释放，
+        # 适合大批量计数；此模式下不能 save()/view()
+        self.slim = slim
+        if image is None:
+            with self._stage("read"):
+                image = self._read_image()
+        self.original_image = image
+        self.process_image = self.original_image  # 第二次检测时会重置为拉伸图的副本，此前无需拷贝
+        with self._stage("preprocess"):
+            self.stretched_image = self.stretch_bright_region(self.process_image)
+            self.process_mask = self._create_initial_mask()
+        # 检测区域：roi 为 "mask"（亮区密集范围）、"ratio"（图像下部）或 (x0, y0, x1, y1)，None 表示整图
+        self.image_shape = self.original_image.shape
+        height, width = self.image_shape
+        self.roi = (0, 0, width, height)
+        if roi is not None:
+            with self._stage("roi"):
+                self._crop_to_roi(roi)
+        if slim:
+            # 原图此后只用于绘图和缓存键
+            if cache is not None:
+                self._digest = image_digest(self.original_image)
+            self.original_image = self.process_image = None
         self.most_common_scale = None
+        self.scale_spread = None  # 第一次检测特征点尺度的相对离散度（仅 sift 方法），越大说明尺度越不统一
+        self.bright_area = None  # 尺度确定时蒙版的亮区像素数（工作图像），用于衡量检测后剩余的未覆盖亮区
         self.target_sigma = None
+        self.scale_factor = 1.0  # 工作图像相对原图的缩放比例
         
         # 存储各次检测结果
         self.filtered_kps = []
         self.filtered_kps_third = []
         self.filtered_kps_fourth = []
+        self.detections = np.empty(0, DETECTION_DTYPE)  # 全部检测结果（原图坐标），见 count_results.py
+        self.residual_area = None  # 第四次检测后蒙版剩余的亮区像素数（工作图像）
+        self._last_pass = 1  # 最近运行的检测次数（1 为尺度估计）
+        self._pass_inputs = {}  # 各次检测开始前的 (蒙版, 涂黑图像, 上游缓存键)，用于重新运行（精简模式不保存）
+
+    def _stage(self, name):
+        """性能记录上下文（未开启时为空操作）"""
+        return self.profiler.stage(name, image=self.image_name)
+
+    def _cache_lookup(self, stage, params, parent=None):
+        """查询阶段缓存，返回 (键, 缓存值)；未开启缓存时返回 (None, None)"""
+        if self.cache is None:
+            return None, None
+        if self._digest is None:
+            self._digest = image_digest(self.original_image)
+        # 拉伸与蒙版参数影响所有阶段
+        params = dict(params, threshold_low=self.threshold_low, mask_threshold=self.params["mask_threshold"],
+                      roi=self.roi)
+        key = stage_key(self._digest, stage, params, parent)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key, value, stage):
+        if key is not None:
+            self.cache.put(key, value, stage)
+
+    def _detect_and_refine(self, stage, tolerance, detect, params):
+        """
+        检测并筛选，返回 (工作图像坐标下保留的特征点, 原始特征点数量)
+
+        开启缓存时，参数与上游均未变化的阶段直接复用缓存的特征点，不再运行SIFT。
+        每次检测都在上一次涂黑后的蒙版上进行，因此缓存键链接上一阶段的键：
+        修改某次检测的参数只会使该次及之后的检测重新计算。第三、四次检测读取的蒙版还取决于涂黑半径，
+        其参数中需包含 blackout_factor。
+        """
+        params = dict(params, tolerance=tolerance, fine_sift=self.params["fine_sift"],
+                      min_dist_factor=self.params["min_dist_factor"])
+        key, cached = self._cache_lookup(stage, params, self._parent_key)
+        self._parent_key = key
+        if cached is not None:
+            with self._stage(f"{stage}.cache_hit"):
+                return array_to_keypoints(cached["keypoints"]), cached["raw"]
+        with self._stage(f"{stage}.sift"):
+            keypoints = detect()
+        kept = self._refine(stage, keypoints, tolerance)
+        self._cache_store(key, {"keypoints": keypoints_to_array(kept), "raw": len(keypoints)}, stage)
+        return kept, len(keypoints)
+
+    @property
+    def work_scale(self):
+        """工作图像（可能已缩放）中的钢材尺度"""
+        return self.most_common_scale * self.scale_factor
 
     def _read_image(self):
         """读取灰度图像"""
@@ -33,23 +182,29 @@ class SteelCounter:
         return img
 
     def stretch_bright_region(self, image):
-        """增强亮度区间细节"""
-        stretched = image.copy().astype(np.float32)
-        stretched[stretched < self.threshold_low] = 0
-        bright_region = stretched[stretched >= self.threshold_low]
-        if len(bright_region) > 0:
-            stretched[stretched >= self.threshold_low] = (
-                (bright_region - self.threshold_low) / (255 - self.threshold_low) * 255
-            )
-        return stretched.astype(np.uint8)
+        """增强亮度区间细节（查表实现，避免整图float32拷贝）"""
+        levels = np.arange(256, dtype=np.float32)
+        lut = np.where(
+            levels >= self.threshold_low,
+            (levels - self.threshold_low) / (255 - self.threshold_low) * 255,
+            0
+        ).astype(np.uint8)
+        return cv2.LUT(image, lut)
 
     def _create_initial_mask(self):
         """创建初始高亮区域蒙版"""
-        _, high_light_mask = cv2.threshold(self.stretched_image, 50, 255, cv2.THRESH_BINARY)
+        _, high_light_mask = cv2.threshold(self.stretched_image, self.params["mask_threshold"], 255, cv2.THRESH_BINARY)
         kernel = np.ones((3, 3), np.uint8)
         high_light_mask = cv2.morphologyEx(high_light_mask, cv2.MORPH_CLOSE, kernel)
         return cv2.morphologyEx(high_light_mask, cv2.MORPH_OPEN, kernel)
 
+    def _crop_to_roi(self, roi):
+        """只保留 ROI 内的拉伸图与蒙版，之后的检测都在裁剪图上进行"""
+        self.roi = find_roi(roi, mask=self.process_mask)
+        x0, y0, x1, y1 = self.roi
+        self.stretched_image = self.stretched_image[y0:y1, x0:x1].copy()
+        self.process_mask = self.process_mask[y0:y1, x0:x1].copy()
+
     def _filter_by_scale(self, keypoints, target_scale, tolerance):
         """根据尺度筛选特征点"""
         scales = [kp.size for kp in keypoints]
@@ -61,48 +216,158 @@ class SteelCounter:
         ]
         return [kp for kp, sm in zip(keypoints, scale_mask) if sm]
 
-    def _remove_close_points(self, keypoints, min_dist_factor=0.9):
+    def _remove_close_points(self, keypoints, min_dist_factor=None):
         """去除过近的特征点"""
         if not keypoints:
             return []
+        if min_dist_factor is None:
+            min_dist_factor = self.params["min_dist_factor"]
         coords = np.array([kp.pt for kp in keypoints])
-        keep = []
-        retained_coords = []
-        for i, coord in enumerate(coords):
-            if i == 0:
-                keep.append(True)
-                retained_coords.append(coord)
-            else:
-                dists = distance.cdist([coord], retained_coords)
-                min_dist = np.min(dists) if retained_coords else 0
-                if min_dist > self.most_common_scale * min_dist_factor:
-                    keep.append(True)
-                    retained_coords.append(coord)
-                else:
-                    keep.append(False)
+        keep = dedup_mask(coords, self.work_scale * min_dist_factor)
         return [kp for kp, k in zip(keypoints, keep) if k]
 
     def _blackout_regions(self, image, mask, keypoints, radius_factor):
-        """在图像和蒙版上涂黑指定区域"""
+        """在图像和蒙版上涂黑指定区域（image 为 None 时只涂黑蒙版）"""
         for kp in keypoints:
             x, y = map(int, kp.pt)
-            radius = int(self.most_common_scale * radius_factor)
-            cv2.circle(image, (x, y), radius, 0, -1)
+            radius = int(self.work_scale * radius_factor)
+            if image is not None:
+                cv2.circle(image, (x, y), radius, 0, -1)
             cv2.circle(mask, (x, y), radius, 0, -1)
 
+    def _detect_in_blobs(self, sift, image, pad_factor=2.5, align=32):
+        """仅在剩余亮斑（连通域）附近的裁剪区域内运行SIFT，并将特征点映射回整图坐标"""
+        mask = self.process_mask
+        h, w = mask.shape
+        num, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if num <= 1:
+            return []
+
+        # 每个连通域外扩后的裁剪框；左上角对齐到 align 的整数倍，保证金字塔采样网格与整图一致
+        pad = int(np.ceil(self.work_scale * pad_factor))
+        left = stats[1:, cv2.CC_STAT_LEFT]
+        top = stats[1:, cv2.CC_STAT_TOP]
+        bx0 = np.maximum(left - pad, 0) // align
+        by0 = np.maximum(top - pad, 0) // align
+        bx1 = -(-np.minimum(left + stats[1:, cv2.CC_STAT_WIDTH] + pad, w) // align)
+        by1 = -(-np.minimum(top + stats[1:, cv2.CC_STAT_HEIGHT] + pad, h) // align)
+
+        # 在 align 倍降采样的覆盖图上合并相互重叠的裁剪框
+        cover = np.zeros((-(-h // align), -(-w // align)), np.uint8)
+        for x0, y0, x1, y1 in zip(bx0, by0, bx1, by1):
+            cover[y0:y1, x0:x1] = 255
+        num_groups, cover_labels = cv2.connectedComponents(cover, connectivity=4)
+        if int(np.count_nonzero(cover)) * align * align >= h * w:
+            # 剩余区域已覆盖整图，直接整图检测
+            return list(sift.detect(image, mask=mask))
+
+        # 连通域编号 -> 所属裁剪组
+        group_of = np.zeros(num, np.int32)
+        group_of[1:] = cover_labels[by0, bx0]
+
+        keypoints = []
+        for group in range(1, num_groups):
+            gy, gx = np.nonzero(cover_labels == group)
+            x0, y0 = gx.min() * align, gy.min() * align
+            x1, y1 = min((gx.max() + 1) * align, w), min((gy.max() + 1) * align, h)
+            # 只保留属于本组连通域的位置，避免相邻裁剪区域重复检测
+            crop_mask = (group_of[labels[y0:y1, x0:x1]] == group).astype(np.uint8) * 255
+            crop_kps = sift.detect(np.ascontiguousarray(image[y0:y1, x0:x1]), mask=crop_mask)
+            for kp in crop_kps:
+                kp.pt = (kp.pt[0] + x0, kp.pt[1] + y0)
+            keypoints.extend(crop_kps)
+
+        # 与整图检测的输出顺序保持一致（SIFT按坐标、尺度排序输出）
+        keypoints.sort(key=lambda kp: (kp.pt[0], kp.pt[1], kp.size, kp.angle))
+        return keypoints
+
+    def _detect_remaining(self, sift):
+        """在当前蒙版上检测剩余特征点"""
+        if self.restrict_to_blobs:
+            return self._detect_in_blobs(sift, self.process_mask)
+        return sift.detect(self.process_mask, mask=self.process_mask)
+
     def first_detection(self):
         """第一次检测：估计最常见的钢材尺度"""
-        sift_coarse = cv2.SIFT_create(
-            nfeatures=100,
-            contrastThreshold=0.1,
-            edgeThreshold=5,
-            sigma=11
-        )
+        with self._stage("first_detection") as record:
+            # 缓存值格式变化时递增 version，旧格式的缓存不再命中（v2：(尺度, 尺度离散度)，v1 只有尺度）
+            params = {"scale_method": self.scale_method, "version": 2}
+            if self.scale_method == "sift":
+                params["coarse_sift"] = self.params["coarse_sift"]
+            key, cached = self._cache_lookup("first_detection", params)
+            if cached is not None:
+                self.most_common_scale, self.scale_spread = cached
+                record["cache_hit"] = True
+            elif self.scale_method == "sift":
+                self.most_common_scale = self._estimate_scale_sift()
+            elif self.scale_method in SCALE_ESTIMATORS:
+                self.most_common_scale = SCALE_ESTIMATORS[self.scale_method](self.stretched_image, self.process_mask)
+            else:
+                raise ValueError(f"未知的尺度估计方法: {self.scale_method}")
+            if cached is None:
+                self._cache_store(key, (self.most_common_scale, self.scale_spread), "first_detection")
+            record["scale"] = self.most_common_scale
+        print(f"第一次检测确定的钢材尺度（半径）: {self.most_common_scale:.2f}")
+        self.set_scale(self.most_common_scale)
+
+    def set_scale(self, most_common_scale):
+        """直接设定钢材尺度（可跳过第一次检测，例如复用其他图像或整图的估计结果）"""
+        self.most_common_scale = most_common_scale
+        if self.target_scale is not None:
+            self._rescale_to_target()
+        self.target_sigma = self.work_scale / (5 * np.sqrt(2))
+        self.bright_area = cv2.countNonZero(self.process_mask)
+        self._parent_key = repr((float(most_common_scale), self.target_scale))
+
+    def _rescale_to_target(self):
+        """归一化分辨率：按估计尺度缩小工作图像，使钢材尺度接近 target_scale（不放大）"""
+        factor = self.target_scale / self.most_common_scale
+        if factor >= 1:
+            return
+        self.scale_factor = factor
+        self.stretched_image = cv2.resize(self.stretched_image, None, fx=factor, fy=factor,
+                                          interpolation=cv2.INTER_AREA)
+        mask = cv2.resize(self.process_mask, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        _, self.process_mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+        # 实际缩放比例以取整后的尺寸为准
+        self.scale_factor = self.stretched_image.shape[1] / (self.roi[2] - self.roi[0])
+
+    def _to_original(self, keypoints):
+        """将工作图像上的特征点映射回原图坐标（先还原缩放，再加上 ROI 偏移）"""
+        x0, y0 = self.roi[:2]
+        if self.scale_factor == 1.0 and x0 == 0 and y0 == 0:
+            return keypoints
+        f = self.scale_factor
+        return [
+            cv2.KeyPoint(kp.pt[0] / f + x0, kp.pt[1] / f + y0, kp.size / f, kp.angle, kp.response, kp.octave,
+                         kp.class_id)
+            for kp in keypoints
+        ]
+
+    def _mask_in_original(self):
+        """返回原图尺寸的当前蒙版（ROI 以外为 0）"""
+        x0, y0, x1, y1 = self.roi
+        mask = self.process_mask
+        if self.scale_factor != 1.0:
+            mask = cv2.resize(mask, (x1 - x0, y1 - y0), interpolation=cv2.INTER_NEAREST)
+        if mask.shape == self.image_shape:
+            return mask
+        full = np.zeros(self.image_shape, np.uint8)
+        full[y0:y1, x0:x1] = mask
+        return full
+
+    def _estimate_scale_sift(self):
+        """使用大sigma的SIFT估计最常见尺度"""
+        sift_coarse = get_sift(**self.params["coarse_sift"])
         keypoints_coarse = sift_coarse.detect(self.stretched_image, mask=self.process_mask)
         scales_coarse = [kp.size for kp in keypoints_coarse]
         if not scales_coarse:
             raise ValueError("第一次检测未找到特征点，请调整图像或参数")
         
+        # 尺度离散度：相对中位数的中位绝对偏差
+        median = np.median(scales_coarse)
+        self.scale_spread = float(np.median(np.abs(np.subtract(scales_coarse, median))) / median)
+
         scale_counter = Counter(scales_coarse)
         most_common_scales = scale_counter.most_common()
         top_percent_count = max(1, len(most_common_scales) // 5)  # 至少取1个
@@ -112,67 +377,135 @@ class SteelCounter:
         top_counts_sum = sum(count for _, count in most_common_scales[:top_percent_count])
         
         # 使用加权平均值作为最常见尺度
-        self.most_common_scale = (top_scales_sum / top_counts_sum) * 0.9
-        self.target_sigma = self.most_common_scale / (5 * np.sqrt(2))
-        print(f"第一次检测确定的钢材尺度（半径）: {self.most_common_scale:.2f}")
+        return (top_scales_sum / top_counts_sum) * 0.9
 
-    def second_detection(self, tolerance=0.40):
+    def _refine(self, stage, keypoints, tolerance):
+        """按尺度筛选并去除过近点，同时记录各步骤的特征点数量"""
+        with self._stage(f"{stage}.filter") as record:
+            filtered = self._filter_by_scale(keypoints, self.work_scale, tolerance)
+            record["kp_in"] = len(keypoints)
+            record["kp_out"] = len(filtered)
+        with self._stage(f"{stage}.dedup") as record:
+            kept = self._remove_close_points(filtered)
+            record["kp_in"] = len(filtered)
+            record["kp_out"] = len(kept)
+        return kept
+
+    def second_detection(self, tolerance=None):
         """第二次检测：基于目标尺度精准提取"""
-        self.process_image = self.stretched_image.copy()  # 重置处理图像
-        sift_fine = cv2.SIFT_create(
-            contrastThreshold=0.05,
-            edgeThreshold=4,
-            sigma=self.target_sigma
-        )
-        keypoints_fine = sift_fine.detect(self.process_image, mask=self.process_mask)
-        
-        # 筛选特征点
-        self.filtered_kps = self._filter_by_scale(keypoints_fine, self.most_common_scale, tolerance)
-        self.filtered_kps = self._remove_close_points(self.filtered_kps)
-        
-        # 涂黑已检测区域
-        self._blackout_regions(self.process_image, self.process_mask, self.filtered_kps, 1.2)
-        self.second_process_mask = self.process_mask.copy()
+        if tolerance is None:
+            tolerance = self.params["second_tolerance"]
+        with self._stage("second_detection") as record:
+            self._begin_pass(2)
+            # 重置处理图像；精简模式下第三、四次检测只用蒙版，不需要涂黑的图像副本
+            self.process_image = None if self.slim else self.stretched_image.copy()
+            image = self.stretched_image if self.slim else self.process_image
+            sift_fine = get_sift(sigma=self.target_sigma, **self.params["fine_sift"])
+
+            # 检测并筛选特征点
+            self.filtered_kps, raw_count = self._detect_and_refine(
+                "second_detection", tolerance,
+                lambda: sift_fine.detect(image, mask=self.process_mask), {})
+
+            # 涂黑已检测区域
+            with self._stage("second_detection.blackout"):
+                self._blackout_regions(self.process_image, self.process_mask, self.filtered_kps,
+                                       self.params["blackout_factor"])
+            if self.slim:
+                self.stretched_image = None
+            else:
+                self.second_process_mask = self.process_mask.copy()
+            self.filtered_kps = self._record_pass(self._to_original(self.filtered_kps), 2)
+            record["kp_raw"] = raw_count
+            record["kp_kept"] = self.counts[0]
 
-    def third_detection(self, tolerance=0.40):
+    def third_detection(self, tolerance=None):
         """第三次检测：基于涂黑后的图像和蒙版"""
-        sift_third = cv2.SIFT_create(
-            contrastThreshold=0.05,
-            edgeThreshold=4,
-            sigma=self.target_sigma
-        )
-        keypoints_third = sift_third.detect(self.process_mask, mask=self.process_mask)
-        
-        # 筛选特征点
-        self.filtered_kps_third = self._filter_by_scale(keypoints_third, self.most_common_scale, tolerance)
-        self.filtered_kps_third = self._remove_close_points(self.filtered_kps_third)
-        
-        # 涂黑新增区域
-        self._blackout_regions(self.process_image, self.process_mask, self.filtered_kps_third, 1.2)
-        self.third_process_mask = self.process_mask.copy()
+        if tolerance is None:
+            tolerance = self.params["third_tolerance"]
+        with self._stage("third_detection") as record:
+            self._begin_pass(3)
+            sift_third = get_sift(sigma=self.target_sigma, **self.params["fine_sift"])
+
+            # 检测并筛选特征点
+            self.filtered_kps_third, raw_count = self._detect_and_refine(
+                "third_detection", tolerance, lambda: self._detect_remaining(sift_third),
+                {"restrict_to_blobs": self.restrict_to_blobs, "blackout_factor": self.params["blackout_factor"]})
+
+            # 涂黑新增区域
+            with self._stage("third_detection.blackout"):
+                self._blackout_regions(self.process_image, self.process_mask, self.filtered_kps_third,
+                                       self.params["blackout_factor"])
+            if not self.slim:
+                self.third_process_mask = self.process_mask.copy()
+            self.filtered_kps_third = self._record_pass(self._to_original(self.filtered_kps_third), 3)
+            record["kp_raw"] = raw_count
+            record["kp_kept"] = self.counts[1]
 
-    def fourth_detection(self):
+    def fourth_detection(self, tolerance=None):
         """第四次检测：基于蒙版"""
-        sift_fourth = cv2.SIFT_create(
-            contrastThreshold=0.05,
-            edgeThreshold=4,
-            sigma=self.target_sigma
-        )
-        keypoints_fourth = sift_fourth.detect(self.process_mask, mask=self.process_mask)
-        
-        # 筛选特征点
-        self.filtered_kps_fourth = self._filter_by_scale(
-            keypoints_fourth, 
-            self.most_common_scale, 
-            0.25  # 这里使用单独的容忍度
-        )
-        self.filtered_kps_fourth = self._remove_close_points(self.filtered_kps_fourth)
+        if tolerance is None:
+            tolerance = self.params["fourth_tolerance"]  # 这里使用单独的容忍度
+        with self._stage("fourth_detection") as record:
+            self._begin_pass(4)
+            sift_fourth = get_sift(sigma=self.target_sigma, **self.params["fine_sift"])
+
+            # 检测并筛选特征点
+            self.filtered_kps_fourth, raw_count = self._detect_and_refine(
+                "fourth_detection", tolerance, lambda: self._detect_remaining(sift_fourth),
+                {"restrict_to_blobs": self.restrict_to_blobs, "blackout_factor": self.params["blackout_factor"]})
+            self.filtered_kps_fourth = self._record_pass(self._to_original(self.filtered_kps_fourth), 4)
+            self.residual_area = cv2.countNonZero(self.process_mask)
+            if self.slim:
+                self.process_mask = None
+            record["kp_raw"] = raw_count
+            record["kp_kept"] = self.counts[2]
+
+    def _begin_pass(self, pass_id):
+        """
+        开始一次检测：首次运行时保存开始前的蒙版等状态
+
+        重新运行某次检测（如调整 tolerance 后再次调用）时，恢复该次检测开始前的蒙版与涂黑图像
+        （已运行的涂黑不会残留），并丢弃该次及之后各次检测的结果，之后各次检测需按顺序重新运行。
+        精简模式不保留这些状态，重新运行时直接报错。
+        """
+        if self._last_pass >= pass_id:
+            if self.slim:
+                raise RuntimeError("精简模式（slim=True）下各次检测用过的图像已释放，不支持重新运行检测")
+            if pass_id not in self._pass_inputs:
+                raise RuntimeError(f"第 {pass_id} 次检测尚未运行过，各次检测需按顺序运行")
+            mask, image, self._parent_key = self._pass_inputs[pass_id]
+            self.process_mask = mask.copy()
+            if image is not None:
+                self.process_image = image.copy()
+            self.detections = self.detections[self.detections["pass"] < pass_id]
+            for later in range(pass_id, 5):
+                setattr(self, PASS_ATTRS[later], [])
+            self.residual_area = None
+        elif not self.slim:
+            # 第二次检测会从拉伸图重新生成涂黑图像，不需要保存
+            image = None if pass_id == 2 else self.process_image.copy()
+            self._pass_inputs[pass_id] = (self.process_mask.copy(), image, self._parent_key)
+        self._last_pass = pass_id
+
+    def _record_pass(self, keypoints, pass_id):
+        """把一次检测的结果追加到 detections；精简模式下不再保留 cv2.KeyPoint 列表"""
+        self.detections = np.concatenate([self.detections, keypoints_to_detections(keypoints, pass_id)])
+        return None if self.slim else keypoints
+
+    @property
+    def counts(self):
+        """第二、三、四次检测的计数"""
+        passes = self.detections["pass"]
+        return tuple(int(np.count_nonzero(passes == pass_id)) for pass_id in (2, 3, 4))
+
+    def keypoint_array(self):
+        """以 (N, 4) 数组返回全部检测结果：[x, y, size, pass]，坐标为原图坐标"""
+        return detections_to_array(self.detections)
 
     def count_and_print(self):
         """计算并打印总计数结果"""
-        count2 = len(self.filtered_kps)
-        count3 = len(self.filtered_kps_third)
-        count4 = len(self.filtered_kps_fourth)
+        count2, count3, count4 = self.counts
         total = count2 + count3 + count4
         print(f"第二次检测计数: {count2}")
         print(f"第三次检测新增计数: {count3}")
@@ -180,62 +513,66 @@ class SteelCounter:
         print(f"总计数: {total}")
         return total
 
-    def save(self):
-        vis_final = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2BGR)
-        vis_mask = self.process_mask.copy()
-        for kp in self.filtered_kps:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (0, 0, 255), -1)
-        for kp in self.filtered_kps_third:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (0, 255, 0), -1)
-        for kp in self.filtered_kps_fourth:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (255, 0, 0), -1)
-    
-        # 保存结果图像
-        # cv2.imwrite(f'D:/pyLearn/countSteel/results/{self.image_name}_mask.jpg', vis_mask)
+    def _require_images(self):
+        if self.slim:
+            raise ValueError("精简模式（slim=True）不保留图像与特征点，无法绘制结果")
+
+    def _marked_passes(self):
+        """按检测次数分组的原图坐标：[(第二次), (第三次), (第四次)]"""
+        centers = np.stack([self.detections["x"], self.detections["y"]], axis=1)
+        return [centers[self.detections["pass"] == pass_id] for pass_id in (2, 3, 4)]
+
+    def save(self, output_dir=None, fmt=None, writer=None):
+        """
+        绘制并保存最终结果图
+
+        Args:
+            output_dir (str): 输出文件夹，None 时使用 render.default_output_dir
+            fmt (str): 图片格式（jpg / png / bmp），None 时使用 render.default_format
+            writer (render.AsyncImageWriter): 传入时交给后台线程编码写出，不阻塞计数
+        """
+        self._require_images()
+        with self._stage("save"):
+            vis_final = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2BGR)
+            for centers, color in zip(self._marked_passes(), ((0, 0, 255), (0, 255, 0), (255, 0, 0))):
+                stamp(vis_final, centers, 6, color)
+
+            # 保存结果图像
+            path = result_path(self.image_name, "result", output_dir, fmt)
+            if writer is not None:
+                writer.submit(path, vis_final)
+            else:
+                write_image(path, vis_final)
 
-        cv2.imwrite(f'D:/pyLearn/countSteel/results/{self.image_name}_result.jpg', vis_final)
     def view(self):
-        """可视化检测结果"""
+        """
+        可视化检测结果
+
+        Returns:
+            (标记第二次检测结果与蒙版的原图, 第二次检测后涂黑的图像, 第三次检测后涂黑的图像, 最终结果图)，均为 BGR
+        """
+        self._require_images()
+        second, third, fourth = self._marked_passes()
+        base = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2BGR)
+
         # 原始图像标记第二次检测结果
-        vis_original = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2BGR)
-        vis_original[self.process_mask == 255] = vis_original[self.process_mask == 255] * 0.5 + np.array([0, 0, 255]) * 0.5
-        for kp in self.filtered_kps:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_original, (x, y), 3, (0, 255, 0), -1)
-            cv2.circle(vis_original, (x, y), int(kp.size), (255, 0, 0), 1)
+        vis_original = blend_mask(base.copy(), self._mask_in_original(), (0, 0, 255))
+        stamp(vis_original, second, 3, (0, 255, 0))
+        sizes = self.detections["size"][self.detections["pass"] == 2].astype(np.int64)
+        stamp(vis_original, second, sizes, (255, 0, 0), thickness=1)
 
         # 第二次检测后涂黑的图像
-        vis_after_second = cv2.cvtColor(self.original_image.copy(), cv2.COLOR_GRAY2BGR)
-        for kp in self.filtered_kps:
-            x, y = map(int, kp.pt)
-            radius = int(self.most_common_scale * 1.2)
-            cv2.circle(vis_after_second, (x, y), radius, (0, 0, 0), -1)
-            cv2.circle(vis_after_second, (x, y), 3, (0, 255, 0), -1)
+        vis_after_second = stamp(base.copy(), second, int(self.most_common_scale * 1.2), (0, 0, 0))
+        stamp(vis_after_second, second, 3, (0, 255, 0))
 
         # 第三次检测后涂黑的图像
-        vis_after_third = vis_after_second.copy()
-        for kp in self.filtered_kps_third:
-            x, y = map(int, kp.pt)
-            radius = int(self.most_common_scale * 1.1)
-            cv2.circle(vis_after_third, (x, y), radius, (0, 0, 0), -1)
-            cv2.circle(vis_after_third, (x, y), 3, (0, 0, 255), -1)
+        vis_after_third = stamp(vis_after_second.copy(), third, int(self.most_common_scale * 1.1), (0, 0, 0))
+        stamp(vis_after_third, third, 3, (0, 0, 255))
 
         # 最终结果图
-        vis_final = cv2.cvtColor(self.original_image, cv2.COLOR_GRAY2BGR)
-        for kp in self.filtered_kps:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (0, 0, 255), -1)
-        for kp in self.filtered_kps_third:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (0, 0, 255), -1)
-        for kp in self.filtered_kps_fourth:
-            x, y = map(int, kp.pt)
-            cv2.circle(vis_final, (x, y), 6, (0, 0, 255), -1)    
-        
-        
+        vis_final = stamp(base, np.concatenate([second, third, fourth]), 6, (0, 0, 255))
+        return vis_original, vis_after_second, vis_after_third, vis_final
+
 
 # 使用示例
 if __name__ == "__main__":    
@@ -0,0 +1,72 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from task import SteelCounter
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images", "1.bmp")
+
+
+def run_all(counter, fourth_tolerance=None):
+    """依次运行四次检测"""
+    counter.first_detection()
+    counter.second_detection()
+    counter.third_detection()
+    counter.fourth_detection(fourth_tolerance)
+    return counter
+
+
+class RerunPassTest(unittest.TestCase):
+    """重新运行某次检测时，计数与从头运行一致，不重复计数"""
+
+    def setUp(self):
+        self._quiet = redirect_stdout(io.StringIO())
+        self._quiet.__enter__()
+        self.counter = run_all(SteelCounter(IMAGE))
+        self.counts = self.counter.counts
+        self.points = self.counter.keypoint_array().copy()
+
+    def tearDown(self):
+        self._quiet.__exit__(None, None, None)
+
+    def test_repeat_last_pass(self):
+        self.counter.fourth_detection()
+        self.assertEqual(self.counter.counts, self.counts)
+        np.testing.assert_array_equal(self.counter.keypoint_array(), self.points)
+
+    def test_retune_last_pass(self):
+        fresh = run_all(SteelCounter(IMAGE), fourth_tolerance=0.4)
+        self.counter.fourth_detection(tolerance=0.4)
+        self.assertEqual(self.counter.counts, fresh.counts)
+        self.assertEqual(len(self.counter.detections), sum(fresh.counts))
+
+    def test_rerun_earlier_pass(self):
+        # 第三次检测的涂黑需被撤销，否则重新运行时检测不到原来的钢筋
+        self.counter.third_detection()
+        self.assertEqual(self.counter.counts, self.counts[:2] + (0,))
+        self.assertEqual(self.counter.filtered_kps_fourth, [])
+        self.assertIsNone(self.counter.residual_area)
+        self.counter.fourth_detection()
+        self.assertEqual(self.counter.counts, self.counts)
+
+    def test_rerun_from_second_pass(self):
+        self.counter.second_detection()
+        self.counter.third_detection()
+        self.counter.fourth_detection()
+        self.assertEqual(self.counter.counts, self.counts)
+        np.testing.assert_array_equal(self.counter.keypoint_array(), self.points)
+
+    def test_slim_rerun_raises(self):
+        counter = run_all(SteelCounter(IMAGE, slim=True))
+        self.assertEqual(counter.counts, self.counts)
+        for rerun in (counter.fourth_detection, counter.third_detection, counter.second_detection):
+            with self.assertRaises(RuntimeError):
+                rerun()
+        self.assertEqual(counter.counts, self.counts)
+
+
+if __name__ == "__main__":
+    unittest.main()
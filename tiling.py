@@ -0,0 +1,279 @@
+import os
+import time
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from dedup import dedup_mask
+from scale_estimation import SCALE_ESTIMATORS
+from task import SteelCounter
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+default_tile_size = 1024   # 分块边长（像素），决定单块处理时的内存上限
+default_overlap = 128      # 相邻分块的重叠宽度（像素），应不小于钢筋直径的2倍
+default_workers = 1        # 并行处理分块的进程数
+# --------------------------------------------------------------------------
+
+
+def _tile_starts(length, tile_size, overlap):
+    """计算一维方向上各分块的起点，最后一块与图像边缘对齐"""
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def _core_bounds(starts, tile_size, length):
+    """每个分块的"归属区间"：以相邻分块重叠区的中线为界，保证每个位置只属于一个分块"""
+    bounds = []
+    for i, start in enumerate(starts):
+        low = 0 if i == 0 else (starts[i - 1] + tile_size + start) / 2
+        high = length if i == len(starts) - 1 else (start + tile_size + starts[i + 1]) / 2
+        bounds.append((low, high))
+    return bounds
+
+
+def iter_tiles(height, width, tile_size=default_tile_size, overlap=default_overlap):
+    """
+    生成重叠分块
+
+    Yields:
+        (x0, y0, x1, y1, core)，core 为该分块负责计数的区域 (cx0, cy0, cx1, cy1)
+    """
+    xs = _tile_starts(width, tile_size, overlap)
+    ys = _tile_starts(height, tile_size, overlap)
+    x_cores = _core_bounds(xs, tile_size, width)
+    y_cores = _core_bounds(ys, tile_size, height)
+    for y0, (cy0, cy1) in zip(ys, y_cores):
+        for x0, (cx0, cx1) in zip(xs, x_cores):
+            yield x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height), (cx0, cy0, cx1, cy1)
+
+
+class ArrayTileReader:
+    """已在内存中的灰度图，提供与 BmpTileReader 相同的按区域读取接口"""
+
+    def __init__(self, image):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+
+    def read(self, x0, y0, x1, y1):
+        """读取 [y0:y1, x0:x1] 区域（返回拷贝）"""
+        return self.image[y0:y1, x0:x1].copy()
+
+    def overview(self, max_side):
+        """降采样到最长边不超过 max_side，返回 (概览图, 缩放比例)"""
+        factor = min(1.0, max_side / max(self.height, self.width))
+        if factor == 1.0:
+            return self.image, factor
+        return cv2.resize(self.image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA), factor
+
+
+class BmpTileReader:
+    """
+    以只读内存映射打开未压缩的 BMP（8 位调色板 / 24 位 / 32 位），按区域读取灰度图，不解码整图
+
+    读取结果与 cv2.imread(path, cv2.IMREAD_GRAYSCALE) 对应区域一致。
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(54)
+            if header[:2] != b"BM" or len(header) < 54:
+                raise ValueError(f"'{path}' 不是 BMP 文件")
+            offset = struct.unpack("<I", header[10:14])[0]
+            header_size, width, height, _, bits, compression = struct.unpack("<IiiHHI", header[14:34])
+            colors = struct.unpack("<I", header[46:50])[0] or (1 << bits if bits == 8 else 0)
+            if header_size < 40 or compression != 0 or bits not in (8, 24, 32):
+                raise ValueError(f"'{path}' 不是未压缩的 8/24/32 位 BMP")
+            if bits == 8:
+                f.seek(14 + header_size)
+                palette = np.frombuffer(f.read(4 * colors), np.uint8).reshape(-1, 1, 4)[:, :, :3]
+                # 调色板转灰度后作为查找表，与逐像素转换结果相同
+                self.lut = np.zeros(256, np.uint8)
+                self.lut[:len(palette)] = cv2.cvtColor(palette, cv2.COLOR_BGR2GRAY)[:, 0]
+        self.channels = bits // 8
+        self.width, self.height = width, abs(height)
+        self.bottom_up = height > 0  # BMP 默认自下而上存储各行
+        stride = (width * self.channels + 3) // 4 * 4
+        self.data = np.memmap(path, np.uint8, "r", offset, shape=(self.height, stride))
+
+    def read(self, x0, y0, x1, y1):
+        """读取 [y0:y1, x0:x1] 区域的灰度图，只访问该区域所在的行"""
+        if self.bottom_up:
+            rows = self.data[self.height - y1:self.height - y0][::-1]
+        else:
+            rows = self.data[y0:y1]
+        pixels = np.ascontiguousarray(rows[:, x0 * self.channels:x1 * self.channels])
+        if self.channels == 1:
+            return self.lut[pixels]
+        code = cv2.COLOR_BGR2GRAY if self.channels == 3 else cv2.COLOR_BGRA2GRAY
+        return cv2.cvtColor(pixels.reshape(y1 - y0, x1 - x0, self.channels), code)
+
+    def overview(self, max_side, band_rows=default_tile_size):
+        """
+        逐条带降采样到最长边不超过 max_side，返回 (概览图, 缩放比例)
+
+        每次只读取 band_rows 行；条带边界处的插值与整图降采样略有差异，对尺度估计没有影响。
+        """
+        factor = min(1.0, max_side / max(self.height, self.width))
+        if factor == 1.0:
+            return self.read(0, 0, self.width, self.height), factor
+        out_width = max(1, round(self.width * factor))
+        bands = []
+        for y0 in range(0, self.height, band_rows):
+            y1 = min(y0 + band_rows, self.height)
+            out_rows = round(y1 * factor) - round(y0 * factor)
+            if out_rows > 0:
+                bands.append(cv2.resize(self.read(0, y0, self.width, y1), (out_width, out_rows),
+                                        interpolation=cv2.INTER_AREA))
+        return np.vstack(bands), factor
+
+
+def open_tiles(image_path):
+    """未压缩 BMP 以内存映射按区域读取，其他格式（需要解码）整图读入内存"""
+    try:
+        return BmpTileReader(image_path)
+    except ValueError:
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError("无法读取图像，请检查文件路径是否正确")
+        return ArrayTileReader(image)
+
+
+def overview_counter(image, max_side=default_tile_size, threshold_low=80):
+    """
+    将整图降采样到最长边不超过 max_side，返回 (概览图上的 SteelCounter, 缩放比例)
+
+    image 可以是灰度图数组，也可以是 open_tiles 返回的读取器
+    """
+    reader = ArrayTileReader(image) if isinstance(image, np.ndarray) else image
+    overview, factor = reader.overview(max_side)
+    return SteelCounter("overview", image=overview, threshold_low=threshold_low), factor
+
+
+def estimate_global_scale(image, max_side=default_tile_size, threshold_low=80, scale_method="distance"):
+    """
+    在降采样的整图概览上估计钢材尺度，内存占用不超过一个分块
+
+    SIFT尺度估计的 sigma 针对原分辨率设定，概览图上只能使用 scale_estimation 中的快速方法（distance / autocorr）
+    """
+    if scale_method not in SCALE_ESTIMATORS:
+        raise ValueError(f"概览图尺度估计不支持 '{scale_method}'，可选: {', '.join(SCALE_ESTIMATORS)}")
+    counter, factor = overview_counter(image, max_side, threshold_low)
+    # 估计方法内部的降采样与概览缩放叠加后保持与整图估计相同的分辨率
+    estimator_factor = min(1.0, 0.25 / factor)
+    return SCALE_ESTIMATORS[scale_method](counter.stretched_image, counter.process_mask, estimator_factor) / factor
+
+
+def count_tile(tile, offset, core, name="", counter_kwargs=None, scale=None):
+    """
+    对单个分块执行四次检测，返回归属于该分块的特征点与尺度（scale 为 None 时在分块内单独估计尺度）
+
+    Returns:
+        (points, scale)，points 为 (N, 4) 数组 [x, y, size, pass]，坐标为整图坐标
+    """
+    counter = SteelCounter(name, image=tile, **(counter_kwargs or {}))
+    if not counter.process_mask.any():
+        # 该分块内没有亮斑
+        return np.empty((0, 4), np.float32), None
+    if scale is None:
+        try:
+            counter.first_detection()
+        except ValueError:
+            return np.empty((0, 4), np.float32), None
+    else:
+        counter.set_scale(scale)
+    counter.second_detection()
+    counter.third_detection()
+    counter.fourth_detection()
+
+    points = counter.keypoint_array()
+    points[:, 0] += offset[0]
+    points[:, 1] += offset[1]
+
+    # 只保留落在本分块归属区域内的点，重叠区中的其余点由相邻分块负责
+    cx0, cy0, cx1, cy1 = core
+    inside = (points[:, 0] >= cx0) & (points[:, 0] < cx1) & (points[:, 1] >= cy0) & (points[:, 1] < cy1)
+    return points[inside], counter.most_common_scale
+
+
+def _count_tile_job(job):
+    """进程池任务入口"""
+    return count_tile(*job)
+
+
+def count_tiled(image_path, tile_size=default_tile_size, overlap=default_overlap, workers=default_workers,
+                min_dist_factor=0.9, shared_scale=True, overview_method="distance", **counter_kwargs):
+    """
+    分块计数：每个分块独立运行四次检测，再合并接缝处的重复点
+
+    Args:
+        image_path (str): 图片路径
+        tile_size (int): 分块边长
+        overlap (int): 相邻分块重叠宽度
+        workers (int): 并行进程数，1 表示串行
+        min_dist_factor (float): 接缝去重距离（相对钢材尺度）
+        shared_scale (bool): 是否由整图概览统一估计尺度（False 时每个分块单独估计）
+        overview_method (str): 概览图上的尺度估计方法（distance / autocorr），仅 shared_scale 时使用
+        counter_kwargs: 传给 SteelCounter 的参数
+
+    未压缩 BMP 按分块从内存映射中读取，不解码整图；其他格式需要先整图解码。
+    """
+    reader = open_tiles(image_path)
+    height, width = reader.height, reader.width
+    name = os.path.basename(image_path)
+    # 各分块使用同一尺度，避免分块内样本少导致尺度估计不一致
+    scale = None
+    if shared_scale:
+        scale = estimate_global_scale(reader, tile_size, counter_kwargs.get("threshold_low", 80), overview_method)
+
+    def jobs():
+        for x0, y0, x1, y1, core in iter_tiles(height, width, tile_size, overlap):
+            yield reader.read(x0, y0, x1, y1), (x0, y0), core, name, counter_kwargs, scale
+
+    if workers <= 1:
+        results = [count_tile(*job) for job in jobs()]
+    else:
+        # 分批提交，避免所有分块的拷贝同时驻留在任务队列中
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            for job in jobs():
+                pending.append(executor.submit(_count_tile_job, job))
+                if len(pending) >= workers * 2:
+                    results.append(pending.pop(0).result())
+            results.extend(future.result() for future in pending)
+
+    scales = [scale for _, scale in results if scale is not None]
+    points = np.concatenate([pts for pts, _ in results]) if results else np.empty((0, 4), np.float32)
+    if not scales:
+        return {"total": 0, "points": points, "scale": None, "tiles": len(results)}
+
+    # 合并接缝两侧被重复检测的钢筋
+    scale = float(np.median(scales))
+    if len(points) > 0:
+        points = points[dedup_mask(points[:, :2], scale * min_dist_factor)]
+    return {"total": len(points), "points": points, "scale": scale, "tiles": len(results)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="大图分块钢筋计数")
+    parser.add_argument("image", help="图片路径")
+    parser.add_argument("--tile-size", type=int, default=default_tile_size, help="分块边长（像素）")
+    parser.add_argument("--overlap", type=int, default=default_overlap, help="分块重叠宽度（像素）")
+    parser.add_argument("--workers", type=int, default=default_workers, help="并行进程数")
+    parser.add_argument("--per-tile-scale", action="store_true", help="每个分块单独估计尺度")
+    parser.add_argument("--overview-method", default="distance", choices=list(SCALE_ESTIMATORS),
+                        help="概览图上的尺度估计方法")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = count_tiled(args.image, args.tile_size, args.overlap, args.workers,
+                         shared_scale=not args.per_tile_scale, overview_method=args.overview_method)
+    print(f"分块数: {result['tiles']}")
+    print(f"总计数: {result['total']}，耗时 {time.perf_counter() - start:.2f}s")
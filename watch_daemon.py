@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import signal
+import hashlib
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from backends import BACKENDS
+from batch_count import count_image, _init_worker, image_exts
+from cascade import CascadeCounter
+from predict_pipeline import (ReplayModel, count_result, load_model, model_cache_key, predict_images,
+                              replay_cache_key, weights_path, imgsz, conf, backend, int8)
+from result_cache import ResultCache, file_digest
+from roi import ROI_MODES
+
+# -------------------------- 请在这里指定默认参数 --------------------------
+watch_dir = "task"                          # 监视的输入文件夹
+manifest_path = "logs/watch_manifest.jsonl"  # 已处理文件清单（JSONL，追加写入），重启后据此跳过已计数的图片
+poll_interval = 0.2     # 扫描间隔（秒）
+settle_time = 0.1       # 文件最后修改后至少经过该时间才处理，避免读到相机尚未写完的图片
+method = "sift"         # 计数方法：sift（四次SIFT检测，每张约 3~4 秒）/ yolo（YOLO模型）/ cascade（SIFT置信度低时再用YOLO）
+workers = max(1, (os.cpu_count() or 1) - 1)  # sift 的计数进程数（留一个核给扫描与其他程序）
+model_workers = 1       # yolo / cascade 的计数进程数：每个进程各加载一份模型，且模型推理本身已是多线程
+max_pending = None      # 同时在途的任务上限，None 表示 2 * workers；达到上限时暂停提交，新图片留在磁盘等待下一轮
+# --------------------------------------------------------------------------
+
+
+def _init_daemon_worker():
+    """工作进程忽略 Ctrl+C，由主进程等待在途任务完成后统一退出"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker()
+
+
+METHODS = ("sift", "yolo", "cascade")
+_models = {}    # 工作进程内已加载的模型，(weights, backend, int8, replay_labels) -> 模型
+_cascades = {}  # 工作进程内的级联计数器，(模型键, roi) -> CascadeCounter
+
+
+def _worker_model(weights, backend, int8, replay_labels):
+    """每个工作进程只加载一次模型，之后的图片复用"""
+    key = (weights, backend, int8, replay_labels)
+    if key not in _models:
+        _models[key] = ReplayModel(replay_labels) if replay_labels else load_model(weights, backend, int8)
+    return _models[key]
+
+
+def count_image_model(image_path, method="yolo", weights=weights_path, backend=backend, int8=int8,
+                      replay_labels=None, roi=None):
+    """
+    用YOLO或级联方法对单张图片计数，返回字段与 batch_count.count_image 相同（counts、scale 为 None）
+
+    Args:
+        method (str): "yolo" 只用模型计数；"cascade" 先用SIFT计数，置信度低时再用模型（见 cascade.py）
+        replay_labels (str): 用已有的预测标签（文件夹或标签库）代替模型推理
+        roi: 只处理钢筋捆区域（见 roi.py）
+    """
+    start = time.perf_counter()
+    result = {"path": image_path, "method": method, "total": None, "counts": None, "scale": None, "error": None}
+    try:
+        model_key = (weights, backend, int8, replay_labels)
+        if method == "cascade":
+            cascade_key = (model_key, roi)
+            if cascade_key not in _cascades:
+                # 清单已逐张记录结果，不再另写级联决策日志
+                _cascades[cascade_key] = CascadeCounter(model_loader=lambda: _worker_model(*model_key),
+                                                        log_path=None, roi=roi)
+            counted = _cascades[cascade_key].count(image_path)
+            result["method"] = counted["method"]
+        else:
+            results = predict_images(_worker_model(*model_key), image_path, roi=roi, imgsz=imgsz, conf=conf,
+                                     save=False, save_txt=False, verbose=False)
+            counted = count_result(next(results))
+        result["total"] = counted["total"]
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def model_settings(method, weights=weights_path, backend=backend, int8=int8, replay_labels=None, roi=None):
+    """yolo / cascade 的计数设置：模型按身份（含权重修改时间或标签版本）记录，换了模型重启后旧结果视为过期"""
+    model = replay_cache_key(replay_labels) if replay_labels else model_cache_key(weights, backend, int8)
+    return {"method": method, "model": model, "roi": roi}
+
+
+def settings_fingerprint(counter_kwargs):
+    """计数设置（roi、scale_method、target_scale 等）的指纹；cache 不影响结果，不计入"""
+    settings = {name: value for name, value in counter_kwargs.items() if name != "cache"}
+    payload = json.dumps(settings, sort_keys=True, default=repr)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_manifest(path):
+    """读取清单，同一路径以最后一条记录为准；末尾不完整的行（写入时中断）直接忽略"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[record["path"]] = record
+    return entries
+
+
+def compact_manifest(path, entries):
+    """把清单重写为每个路径一条记录（先写临时文件再替换）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in entries.values():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+class WatchDaemon:
+    """
+    监视文件夹的增量计数守护进程
+
+    轮询文件夹，只处理新增或修改过（修改时间/大小变化且内容哈希不同）的图片，结果追加写入清单；
+    最新拍摄的图片优先处理。清单记录计数设置的指纹，换了设置重启后旧结果视为过期重新计数；
+    上次出错的图片在每次启动后重试一次。计数在有界进程池中进行，在途任务达到上限时停止提交（背压），
+    积压的图片留在磁盘上，不会在内存中无限排队。
+
+    默认的 sift 方法每张图片需要 3~4 秒，达不到图片落盘后约 1 秒内出结果；需要低延迟时使用
+    method="yolo"（只用模型计数），模型在每个工作进程中只加载一次。cascade 总是先运行SIFT计数，
+    延迟不低于 sift，只是在置信度低时改用模型的结果。
+
+    示例:
+        WatchDaemon("task", roi="mask").run()
+        WatchDaemon("task", method="yolo", workers=1, weights="runs/detect/train/weights/best.pt").run()
+    """
+
+    def __init__(self, watch_dir=watch_dir, manifest_path=manifest_path, workers=workers, max_pending=max_pending,
+                 poll_interval=poll_interval, settle_time=settle_time, method=method, **counter_kwargs):
+        """
+        Args:
+            watch_dir (str): 监视的文件夹
+            manifest_path (str): 清单路径
+            workers (int): 计数进程数
+            max_pending (int): 在途任务上限
+            poll_interval (float): 扫描间隔（秒）
+            settle_time (float): 文件稳定时间（秒）
+            method (str): 计数方法：sift / yolo / cascade
+            counter_kwargs: sift 时传给 SteelCounter 的参数（如 scale_method、roi、cache）；
+                yolo / cascade 时传给 count_image_model 的参数（weights、backend、int8、replay_labels、roi）
+        """
+        if method not in METHODS:
+            raise ValueError(f"未知的计数方法 '{method}'，可选：{', '.join(METHODS)}")
+        self.watch_dir = watch_dir
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.method = method
+        if method == "sift":
+            self.worker = partial(count_image, **counter_kwargs)
+            self.settings = settings_fingerprint(counter_kwargs)
+        else:
+            self.worker = partial(count_image_model, method=method, **counter_kwargs)
+            self.settings = settings_fingerprint(model_settings(method, **counter_kwargs))
+        self.attempted = set()  # 本次运行中已提交计数的图片（出错的只在重启后或文件变化后重试）
+        self.entries = load_manifest(manifest_path)
+        self.pending = {}  # future -> 清单记录（不含结果）
+        self.processed = 0
+        if os.path.dirname(manifest_path):
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        if self.entries:
+            compact_manifest(manifest_path, self.entries)
+
+    def _append(self, record):
+        self.entries[record["path"]] = record
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def scan(self):
+        """返回需要处理的 (路径, stat) 列表，最新修改的在前"""
+        now = time.time()
+        in_flight = {record["path"] for record in self.pending.values()}
+        candidates = []
+        with os.scandir(self.watch_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(image_exts):
+                    continue
+                path = os.path.abspath(entry.path)
+                stat = entry.stat()
+                if path in in_flight or now - stat.st_mtime < self.settle_time:
+                    continue
+                if self._is_current(self.entries.get(path), stat):
+                    continue
+                candidates.append((path, stat))
+        candidates.sort(key=lambda item: item[1].st_mtime_ns, reverse=True)
+        return candidates
+
+    def _is_current(self, known, stat):
+        """清单中的记录是否仍然有效：文件未变、设置相同，且不是本次运行尚未重试过的出错记录"""
+        if not known or known["mtime_ns"] != stat.st_mtime_ns or known["size"] != stat.st_size:
+            return False
+        if known.get("settings") != self.settings:
+            return False
+        return not known.get("error") or known["path"] in self.attempted
+
+    def _submit(self, executor, path, stat):
+        """提交一张图片；内容与清单中记录的相同时（仅被复制或触碰）直接沿用结果"""
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return  # 文件在扫描后被移走
+        record = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest,
+                  "settings": self.settings}
+        known = self.entries.get(path)
+        if known and known["hash"] == digest and known.get("settings") == self.settings and not known.get("error"):
+            self._append(dict(known, **record))
+            return
+        self.attempted.add(path)
+        self.pending[executor.submit(self.worker, path)] = record
+
+    def _collect(self, done):
+        for future in done:
+            record = self.pending.pop(future)
+            result = future.result()
+            record.update(method=result.get("method", self.method), total=result["total"], counts=result["counts"],
+                          scale=result["scale"],
+                          error=result["error"], seconds=result["seconds"], time=time.time())
+            self._append(record)
+            self.processed += 1
+            name = os.path.basename(record["path"])
+            if record["error"]:
+                print(f"{name}: 出错（{record['error']}）")
+            else:
+                print(f"{name}: 总计数 {record['total']}，耗时 {record['seconds']:.2f}s")
+
+    def poll_once(self, executor):
+        """扫描一次并在不超过在途上限的前提下提交任务，返回本轮未能提交的积压数量"""
+        candidates = self.scan()
+        for index, (path, stat) in enumerate(candidates):
+            if len(self.pending) >= self.max_pending:
+                return len(candidates) - index
+            self._submit(executor, path, stat)
+        return 0
+
+    def run(self, once=False):
+        """
+        持续监视，Ctrl+C 退出（等待在途任务完成后再退出）
+
+        Args:
+            once (bool): 处理完当前积压后退出（不再等待新图片）
+        """
+        print(f"开始监视 '{self.watch_dir}'（{self.method}），清单中已有 {len(self.entries)} 条记录，进程数 {self.workers}")
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_daemon_worker) as executor:
+            try:
+                while True:
+                    backlog = self.poll_once(executor)
+                    if once and not backlog and not self.pending:
+                        break
+                    if self.pending:
+                        # 有任务完成就立即返回：及时写出结果，并在背压解除后马上提交积压的图片
+                        done, _ = wait(self.pending, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                        self._collect(done)
+                    else:
+                        time.sleep(self.poll_interval)
+            except KeyboardInterrupt:
+                print("正在等待在途任务完成...")
+            self._collect(list(self.pending))
+        print(f"本次共处理 {self.processed} 张图片")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="监视文件夹，增量计数新增或修改的图片")
+    parser.add_argument("--watch", default=watch_dir, help="监视的文件夹")
+    parser.add_argument("--manifest", default=manifest_path, help="已处理文件清单路径")
+    parser.add_argument("--method", default=method, choices=METHODS,
+                        help="计数方法：sift（每张约 3~4 秒）/ yolo（需要约 1 秒内出结果时使用）/ cascade（先SIFT，置信度低时用模型）")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"计数进程数（默认 sift 为 {workers}，yolo / cascade 为 {model_workers}）")
+    parser.add_argument("--max-pending", type=int, default=max_pending, help="在途任务上限（默认 2 * 进程数）")
+    parser.add_argument("--scale-method", default="sift", help="尺度估计方法：sift / distance / autocorr")
+    parser.add_argument("--roi", default=None, choices=ROI_MODES, help="只在钢筋捆区域内检测")
+    parser.add_argument("--cache", default=None, help="中间结果缓存数据库路径，不指定则不缓存（仅 sift）")
+    parser.add_argument("--weights", default=weights_path, help="模型权重路径（yolo / cascade）")
+    parser.add_argument("--backend", default=backend, choices=list(BACKENDS), help="推理后端（yolo / cascade）")
+    parser.add_argument("--int8", action="store_true", default=int8, help="使用 int8 量化模型（仅 openvino）")
+    parser.add_argument("--replay-labels", default=None, help="用已有的预测标签（文件夹或标签库）代替模型推理")
+    parser.add_argument("--once", action="store_true", help="处理完当前积压后退出")
+    args = parser.parse_args()
+
+    if args.method == "sift":
+        cache = ResultCache(args.cache) if args.cache else None
+        counter_kwargs = dict(scale_method=args.scale_method, roi=args.roi, cache=cache)
+    else:
+        counter_kwargs = dict(weights=args.weights, backend=args.backend, int8=args.int8,
+                              replay_labels=args.replay_labels, roi=args.roi)
+    daemon_workers = args.workers or (workers if args.method == "sift" else model_workers)
+    WatchDaemon(args.watch, args.manifest, daemon_workers, args.max_pending, method=args.method,
+                **counter_kwargs).run(once=args.once)